@@ -3,14 +3,615 @@ Learning Path Agent
 Uses Gemini Flash Latest for generating learning paths.
 """
 
+import asyncio
+import concurrent.futures
+import copy
+import functools
+import hashlib
+import importlib.util
+import logging
 import time
 import os
-import json
+import re
+import sys
+import threading
+from pathlib import Path
+import orjson
+import json_repair
+from typing import List, Optional, TypedDict
 from dotenv import load_dotenv
 from google import genai
 from google.genai import types
+from pydantic import BaseModel, Field, ValidationError
+
+logger = logging.getLogger(__name__)
+
+# Headless batch runs can silence progress/stat logging (and the CLI path
+# printout) without touching the host's logging config
+if os.getenv("NEBULA_QUIET"):
+    logger.setLevel(logging.WARNING)
+
+# Output token caps sized from the largest allowed path. Gemini's thinking
+# tokens also count against its cap, hence the extra headroom. Truncated
+# responses are retried once with double.
+MAX_CHAPTERS = 8
+TOKENS_PER_CHAPTER = 350
+MAX_TOKENS_GENERATE = MAX_CHAPTERS * TOKENS_PER_CHAPTER + 1000
+MAX_TOKENS_REGENERATE = MAX_CHAPTERS * TOKENS_PER_CHAPTER
+
+# An adjusted path is about as long as the original, so regeneration asks for
+# 1.2x its estimated size (~4 chars per token), within [min, max_tokens_regenerate]
+REGENERATE_BUDGET_FACTOR = 1.2
+REGENERATE_MIN_TOKENS = 1024
+CHARS_PER_TOKEN = 4
+
+# Upper bound on the free-text inputs of one request (baseline + objective, or
+# goal + feedback), estimated locally so oversize input fails before any API call
+MAX_INPUT_TOKENS = 4000
+
+# Groq model used for adjustments and, when routing is enabled, simple generations
+GROQ_MODEL = "llama-3.3-70b-versatile"
+
+# Requests scoring below this on _request_complexity() may be routed to Groq
+ROUTE_COMPLEXITY_THRESHOLD = 15.0
+_KEYWORD_RE = re.compile(r"[a-z][a-z0-9+#.-]{3,}")
+
+# When feedback routing is enabled, short local edits (rename, reword, tweak
+# one chapter) go to the small Groq model; long feedback or anything that
+# restructures the path stays on GROQ_MODEL
+GROQ_FAST_MODEL = "llama-3.1-8b-instant"
+FEEDBACK_SIMPLE_MAX_WORDS = 30
+_RESTRUCTURE_RE = re.compile(
+    r"\b(reorgani[sz]e|restructure|redesign|rewrite|reorder|rearrange|split|merge|combine"
+    r"|all|every|entire|whole|overall)\b"
+)
+
+# HTTP/2 needs the optional h2 package; without it the clients use pooled HTTP/1.1
+_HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+
+# Transient provider failures (429/5xx, dropped connections) are retried by
+# the SDKs with exponential backoff and jitter before surfacing as errors
+LLM_MAX_ATTEMPTS = 3
+RETRY_INITIAL_DELAY = 1.0
+RETRY_MAX_DELAY = 10.0
+
+# Connection pool sizing shared by the Gemini and Groq httpx clients
+HTTP_MAX_CONNECTIONS = 64
+HTTP_MAX_KEEPALIVE = 32
+
+# Minimum seconds between on_chunk deliveries while streaming
+STREAM_BATCH_INTERVAL = 0.05
+
+# HTTP timeout for Gemini requests, in milliseconds
+GEMINI_TIMEOUT_MS = 120_000
+
+# Default upper bound on concurrent Gemini calls issued by generate_many()
+MAX_CONCURRENT_REQUESTS = 8
+
+# Gemini Batch API polling for generate_batch(); jobs finish in minutes to hours
+BATCH_POLL_INTERVAL = 30
+_BATCH_DONE_STATES = {"JOB_STATE_SUCCEEDED", "JOB_STATE_FAILED", "JOB_STATE_CANCELLED", "JOB_STATE_EXPIRED"}
+
+# Exact-match response cache: hash(model, prompts, config) -> generate() or
+# regenerate_with_feedback() result. Identical requests (same path, goal and
+# feedback) are answered without another LLM call.
+RESPONSE_CACHE_SIZE = 256
+_RESPONSE_CACHE = {}
+
+# Identical generate requests running at the same time share one LLM call:
+# cache key -> concurrent.futures.Future, usable from threads and event loops
+_INFLIGHT = {}
+_INFLIGHT_LOCK = threading.Lock()
+
+# Optional second tier for the exact-match cache, shared across processes and
+# restarts. Enabled by setting REDIS_URL.
+REDIS_CACHE_PREFIX = "nebula:learning_path:"
+REDIS_CACHE_TTL = 7 * 24 * 3600
+
+
+def _singleton(factory):
+    """
+    Thread-safe lazy singleton for client factories.
+
+    Unlike functools.cache, concurrent first calls (e.g. the /setup thread
+    pool) build the client exactly once, so they all share one connection pool.
+    """
+    lock = threading.Lock()
+    instance = []
+
+    @functools.wraps(factory)
+    def get():
+        if not instance:
+            with lock:
+                if not instance:
+                    instance.append(factory())
+        return instance[0]
+
+    return get
+
+
+def _response_cache_key(*parts) -> str:
+    """Hash the model, prompts and sampling config into a cache key."""
+    return hashlib.blake2b("\x1f".join(str(p) for p in parts).encode()).hexdigest()
+
+
+def _normalize_input(text: str) -> str:
+    """Collapse whitespace and case so trivially different phrasings share a cache key."""
+    return " ".join(text.split()).casefold()
+
+
+@_singleton
+def _get_redis():
+    """Process-wide Redis client for the shared cache tier, or None if REDIS_URL is unset."""
+    _load_env()
+    redis_url = os.getenv("REDIS_URL")
+    if not redis_url:
+        return None
+    try:
+        import redis
+    except ImportError:
+        raise ImportError(
+            "redis is required when REDIS_URL is set. "
+            "Install it with: pip install redis"
+        )
+    return redis.Redis.from_url(redis_url)
+
+
+def _remember_locally(key: str, entry: dict):
+    """Put an entry in the in-process tier, evicting the oldest once full."""
+    if len(_RESPONSE_CACHE) >= RESPONSE_CACHE_SIZE:
+        _RESPONSE_CACHE.pop(next(iter(_RESPONSE_CACHE)))
+    _RESPONSE_CACHE[key] = entry
+
+
+def _get_cached_response(key: str):
+    """Return a copy of a cached result (callers may mutate it), or None."""
+    cached = _RESPONSE_CACHE.get(key)
+
+    redis_client = _get_redis() if cached is None else None
+    if redis_client is not None:
+        try:
+            raw = redis_client.get(REDIS_CACHE_PREFIX + key)
+        except Exception as e:
+            logger.warning("Redis cache lookup failed: %s", e)
+            raw = None
+        if raw is not None:
+            cached = orjson.loads(raw)
+            _remember_locally(key, cached)
+
+    if cached is None:
+        return None
+    logger.info("Cache hit: returning stored learning path")
+    return {**copy.deepcopy(cached), "cache_hit": True}
+
+
+def _store_cached_response(key: str, result: dict):
+    """Store a result in the in-process tier and, if configured, in Redis."""
+    # Cache hits cost no tokens, so they must not be logged as usage again
+    entry = {**copy.deepcopy(result), "token_usage": None}
+    _remember_locally(key, entry)
+
+    redis_client = _get_redis()
+    if redis_client is not None:
+        try:
+            redis_client.set(REDIS_CACHE_PREFIX + key, orjson.dumps(entry), ex=REDIS_CACHE_TTL)
+        except Exception as e:
+            logger.warning("Redis cache store failed: %s", e)
+
+
+def _request_complexity(user_context: str, user_goal: str) -> float:
+    """Cheap complexity score from goal length and distinct keywords across both inputs."""
+    keywords = set(_KEYWORD_RE.findall(f"{user_context} {user_goal}".lower()))
+    return 0.4 * len(user_goal.split()) + 0.6 * len(keywords)
+
+
+class PromptTooLargeError(ValueError):
+    """Raised when user-supplied text exceeds MAX_INPUT_TOKENS."""
+
+
+def _check_input_size(*texts: str):
+    """Raise PromptTooLargeError if the texts' estimated token count exceeds MAX_INPUT_TOKENS."""
+    estimate = sum(len(text) for text in texts) // CHARS_PER_TOKEN
+    if estimate > MAX_INPUT_TOKENS:
+        raise PromptTooLargeError(
+            f"Input is too long (~{estimate} tokens, limit {MAX_INPUT_TOKENS}); please shorten it"
+        )
+
+
+def _is_simple_feedback(user_feedback: str) -> bool:
+    """True for short feedback with no sign of a path-wide restructure."""
+    return (
+        len(user_feedback.split()) <= FEEDBACK_SIMPLE_MAX_WORDS
+        and not _RESTRUCTURE_RE.search(user_feedback.lower())
+    )
+
+
+def _join_inflight(key: str):
+    """
+    Register a request as in flight, or join an identical one already running.
+
+    Returns:
+        Tuple of (Future resolving to the leader's result, whether the caller is the leader)
+    """
+    with _INFLIGHT_LOCK:
+        future = _INFLIGHT.get(key)
+        if future is not None:
+            return future, False
+        future = concurrent.futures.Future()
+        _INFLIGHT[key] = future
+        return future, True
+
+
+class _InflightAbandoned(Exception):
+    """Set on an in-flight future whose leader was cancelled; joined callers retry."""
 
-load_dotenv()
+
+def _finish_inflight(key: str, future, result: dict = None, error: Exception = None):
+    """Publish the leader's outcome to every joined caller."""
+    with _INFLIGHT_LOCK:
+        _INFLIGHT.pop(key, None)
+    if error is not None:
+        future.set_exception(error)
+    else:
+        future.set_result(result)
+
+
+def _abandon_inflight(key: str, future):
+    """Drop a cancelled leader's entry so joined callers retry instead of inheriting its cancellation."""
+    _finish_inflight(key, future, error=_InflightAbandoned())
+
+
+def _coalesced_result(result: dict) -> dict:
+    """Copy of a leader's result for a joined caller; its tokens are already logged by the leader."""
+    return {**copy.deepcopy(result), "token_usage": None, "cache_hit": True}
+
+
+@functools.cache
+def _load_env():
+    """Load .env once per process."""
+    load_dotenv()
+
+
+@functools.cache
+def _env(key: str) -> str:
+    """Resolve a required setting once, loading .env on first use."""
+    _load_env()
+    value = os.getenv(key)
+    if not value:
+        raise ValueError(f"{key} not found in .env")
+    return value
+
+
+def _http_client_args() -> dict:
+    """httpx client arguments for every LLM client: HTTP/2 when available and a bounded keep-alive pool."""
+    import httpx
+
+    return {
+        "http2": _HTTP2_AVAILABLE,
+        "limits": httpx.Limits(
+            max_connections=HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=HTTP_MAX_KEEPALIVE,
+        ),
+    }
+
+
+@_singleton
+def _get_gemini_client():
+    """Process-wide Gemini client, so agents share one connection pool."""
+    import httpx
+
+    client_args = _http_client_args()
+    return genai.Client(
+        api_key=_env("GEMINI_API_KEY"),
+        http_options=types.HttpOptions(
+            # Per-operation HTTP timeout (ms) so a stalled stream can't hang a worker
+            timeout=GEMINI_TIMEOUT_MS,
+            client_args=client_args,
+            # With aiohttp installed (langchain-community pulls it in) google-genai
+            # sends client.aio through aiohttp and drops httpx-only args; passing
+            # a transport keeps it on httpx with the same HTTP/2 and pool settings
+            async_client_args={"transport": httpx.AsyncHTTPTransport(**client_args)},
+            retry_options=types.HttpRetryOptions(
+                attempts=LLM_MAX_ATTEMPTS,
+                initial_delay=RETRY_INITIAL_DELAY,
+                max_delay=RETRY_MAX_DELAY,
+                exp_base=2,
+                jitter=1,
+                http_status_codes=[408, 429, 500, 502, 503, 504],
+            ),
+        ),
+    )
+
+
+@_singleton
+def _get_groq_client():
+    """Process-wide Groq client, so adjustments reuse kept-alive connections."""
+    import httpx
+    from groq import Groq
+
+    http_client = httpx.Client(**_http_client_args())
+    # Groq backs off exponentially between retries of 429/5xx and connection errors
+    return Groq(api_key=_env("GROQ_API_KEY"), http_client=http_client, max_retries=LLM_MAX_ATTEMPTS - 1)
+
+
+@_singleton
+def _get_async_groq_client():
+    """
+    Process-wide AsyncGroq client for aregenerate_with_feedback().
+
+    Its connection pool belongs to the event loop that first uses it, so it
+    suits a long-running server loop rather than repeated asyncio.run() calls.
+    """
+    import httpx
+    from groq import AsyncGroq
+
+    http_client = httpx.AsyncClient(**_http_client_args())
+    return AsyncGroq(api_key=_env("GROQ_API_KEY"), http_client=http_client, max_retries=LLM_MAX_ATTEMPTS - 1)
+
+
+@functools.lru_cache(maxsize=32)
+def _generate_config(max_output_tokens: int) -> types.GenerateContentConfig:
+    """
+    Shared Gemini config for a generation, built once per token cap.
+
+    Callers must treat it as read-only and use model_copy() for per-request changes.
+    """
+    return types.GenerateContentConfig(
+        temperature=0.0,
+        top_p=1.0,
+        max_output_tokens=max_output_tokens,
+        response_mime_type="application/json",
+        response_schema=LearningPath,
+        system_instruction=GENERATE_SYSTEM_PROMPT,
+    )
+
+
+class _JsonObjectScanner:
+    """Tracks brace depth across streamed chunks to spot the end of a JSON object."""
+
+    def __init__(self):
+        self.depth = 0
+        self.started = False
+        self.in_string = False
+        self.escape_next = False
+
+    def feed(self, text: str) -> bool:
+        """Consume a chunk; return True once the top-level object has closed."""
+        for char in text:
+            if self.escape_next:
+                self.escape_next = False
+            elif char == '\\':
+                self.escape_next = self.in_string
+            elif char == '"':
+                self.in_string = not self.in_string
+            elif not self.in_string:
+                if char == '{':
+                    self.depth += 1
+                    self.started = True
+                elif char == '}' and self.started:
+                    self.depth -= 1
+                    if self.depth == 0:
+                        return True
+        return False
+
+
+class _ChapterStreamParser:
+    """Pulls each complete object out of the top-level "chapters" array as it streams in."""
+
+    def __init__(self):
+        self.stack = []
+        self.started = False
+        self.in_string = False
+        self.escape_next = False
+        self.last_key = None
+        self.in_chapters = False
+        self._key = None
+        self._chapter = None
+
+    @property
+    def done(self) -> bool:
+        """True once the top-level object has closed."""
+        return self.started and not self.stack
+
+    def feed(self, text: str) -> list:
+        """Consume a chunk; return the chapters that were completed by it."""
+        chapters = []
+        for char in text:
+            if self._chapter is not None:
+                self._chapter.append(char)
+
+            if self.in_string:
+                if self.escape_next:
+                    self.escape_next = False
+                elif char == '\\':
+                    self.escape_next = True
+                elif char == '"':
+                    self.in_string = False
+                    if self._key is not None:
+                        self.last_key = "".join(self._key)
+                        self._key = None
+                elif self._key is not None:
+                    self._key.append(char)
+                continue
+
+            if char == '"':
+                self.in_string = True
+                # Strings directly inside the root object are its keys
+                if len(self.stack) == 1:
+                    self._key = []
+            elif char in '{[':
+                if char == '{' and self.in_chapters and len(self.stack) == 2:
+                    self._chapter = ['{']
+                elif char == '[' and len(self.stack) == 1 and self.last_key == "chapters":
+                    self.in_chapters = True
+                self.stack.append(char)
+                self.started = True
+            elif char in '}]' and self.stack:
+                self.stack.pop()
+                if char == '}' and self._chapter is not None and len(self.stack) == 2:
+                    try:
+                        chapters.append(orjson.loads("".join(self._chapter)))
+                    except orjson.JSONDecodeError:
+                        # Left for _extract_json's repair pass on the full response
+                        logger.debug("Skipping malformed streamed chapter")
+                    self._chapter = None
+                elif char == ']' and self.in_chapters and len(self.stack) == 1:
+                    self.in_chapters = False
+        return chapters
+
+
+class TokenUsage(TypedDict):
+    """Token usage returned alongside a learning path, as logged by app.py"""
+    prompt_tokens: int
+    completion_tokens: int
+    total_tokens: int
+    model_name: str
+
+
+def _pack_gemini_usage(usage_metadata, model_name: str) -> Optional[TokenUsage]:
+    """Read Gemini usage metadata once into a TokenUsage dict."""
+    if usage_metadata is None:
+        return None
+    return {
+        "prompt_tokens": usage_metadata.prompt_token_count,
+        "completion_tokens": usage_metadata.candidates_token_count,
+        "total_tokens": usage_metadata.total_token_count,
+        "model_name": model_name,
+    }
+
+
+def _pack_groq_usage(usage, model_name: str) -> Optional[TokenUsage]:
+    """Read Groq completion usage once into a TokenUsage dict."""
+    if usage is None:
+        return None
+    return {
+        "prompt_tokens": usage.prompt_tokens,
+        "completion_tokens": usage.completion_tokens,
+        "total_tokens": usage.total_tokens,
+        "model_name": model_name,
+    }
+
+
+# Field descriptions are sent to Gemini as part of response_schema, so they
+# carry the per-field guidance instead of a JSON example in the system prompt
+class Journey(BaseModel):
+    """Overall transformation arc of a learning path"""
+    title: str = Field(description="Transformation arc (e.g., 'From X to Y' or 'Becoming a Z')")
+    destination: str = Field(description="One sentence: what they'll be able to do/create/understand at the end")
+
+
+class Chapter(BaseModel):
+    """One chapter of a learning path"""
+    chapter: int = Field(description="1-based position in the path")
+    title: str = Field(description="Achievement-focused title (what you'll accomplish)")
+    outcome: str = Field(description="The concrete capability gained—what you can now build, do, or solve")
+    unlocks: Optional[str] = Field(
+        default=None,
+        description="The natural next question or limitation this creates—the hook into the next chapter (null for final)",
+    )
+    concepts: List[str] = Field(description="2-4 essential ideas, each with brief context")
+    practice: List[str] = Field(description="1-3 hands-on tasks, each with a tangible deliverable")
+
+
+class LearningPath(BaseModel):
+    """Structured-output schema Gemini is constrained to when generating a path"""
+    journey: Journey
+    chapters: List[Chapter]
+
+
+class _ChunkBatcher:
+    """Coalesces streamed text so an on_chunk consumer is called at most every interval, not per chunk."""
+
+    def __init__(self, callback, interval: float = STREAM_BATCH_INTERVAL):
+        self.callback = callback
+        self.interval = interval
+        self.pending = []
+        self.last_flush = time.monotonic()
+
+    def add(self, text: str):
+        """Buffer a chunk, flushing if the interval has elapsed."""
+        self.pending.append(text)
+        if time.monotonic() - self.last_flush >= self.interval:
+            self.flush()
+
+    def flush(self):
+        """Deliver everything buffered so far as one string."""
+        if self.pending:
+            self.callback("".join(self.pending))
+            self.pending = []
+        self.last_flush = time.monotonic()
+
+
+# System prompts are static module constants so every request starts with a
+# byte-identical prefix that providers can serve from their prompt cache.
+# Any edit here invalidates that cached prefix. Nothing dynamic may precede
+# them: per-request data goes in the user message only, after all static text.
+# JSON contract for the Groq prompts; Gemini gets the same guidance from the
+# LearningPath response_schema field descriptions
+JOURNEY_SCHEMA_BLOCK = """{
+  "journey": {
+    "title": "Transformation arc (e.g., 'From X to Y' or 'Becoming a Z')",
+    "destination": "One sentence: what they'll be able to do/create/understand at the end"
+  },
+  "chapters": [
+    {
+      "chapter": 1,
+      "title": "Achievement-focused title (what you'll accomplish)",
+      "outcome": "The concrete capability gained—what you can now build, do, or solve",
+      "unlocks": "The natural next question or limitation this creates—the hook into the next chapter (null for final)",
+      "concepts": ["2-4 essential ideas, each with brief context"],
+      "practice": ["1-3 hands-on tasks, each with a tangible deliverable"]
+    }
+  ]
+}"""
+
+WRITING_STYLE_BLOCK = """## STYLE
+- Write to the user in second person ("you"); vary sentence structure and vocabulary across chapters
+- Use action verbs and name the specific technologies, patterns, or artifacts involved
+- Outcomes should feel like achievements, not checkboxes"""
+
+GENERATE_INSTRUCTIONS_BLOCK = f"""You are an expert instructional designer. Generate a learning journey that bridges the gap between a learner's baseline (current knowledge, skills, experience) and their objective (the outcome they want).
+
+## YOUR TASK
+Create a lean curriculum of **Minimum Viable Knowledge (MVK)**—only what's essential to achieve the objective.
+
+## DESIGN PRINCIPLES
+1. **Gap-Focused**: Only include what closes the baseline→objective gap. Exclude what they already know.
+2. **Narrative Flow**: Like episodes in a series, each chapter ends with a cliffhanger the next resolves, and its artifact/skill becomes the foundation for the next.
+3. **Outcome-Oriented**: Focus on what the user CAN DO after each chapter, not abstract knowledge.
+4. **Lean**: 2-{MAX_CHAPTERS} chapters, each with a clear, non-redundant purpose. Prefer fewer, deeper chapters.
+
+## STRICT EXCLUSION
+Only include a chapter if the learner CANNOT achieve the objective without it. Exclude best practices (unless essential for basic functionality), scope creep, topics needing resources outside the learner's control, and historical context unless directly relevant."""
+
+# Gemini: the output format is enforced by response_schema
+GENERATE_SYSTEM_PROMPT = f"""{GENERATE_INSTRUCTIONS_BLOCK}
+
+{WRITING_STYLE_BLOCK}"""
+
+# Groq has no schema-constrained decoding, so it still gets the JSON contract
+GROQ_GENERATE_SYSTEM_PROMPT = f"""{GENERATE_INSTRUCTIONS_BLOCK}
+
+## OUTPUT FORMAT
+Return a single valid JSON object:
+
+{JOURNEY_SCHEMA_BLOCK}
+
+{WRITING_STYLE_BLOCK}"""
+
+REGENERATE_SYSTEM_PROMPT = f"""You are a curriculum refinement specialist. ADJUST the learning path based on user feedback.
+
+## RULES
+1. The original path is HIGH QUALITY—make MINIMAL changes, only where the feedback asks
+2. Preserve the narrative flow, chapter dependencies and sequential ordering (1, 2, 3, ...)
+3. Do NOT add/remove chapters unless explicitly requested
+
+## OUTPUT FORMAT
+Return ONLY valid JSON:
+
+{JOURNEY_SCHEMA_BLOCK}
+
+{WRITING_STYLE_BLOCK}"""
 
 
 class LearningPathAgent:
@@ -19,19 +620,36 @@ class LearningPathAgent:
     Single-step process: path generation only.
     """
 
-    def __init__(self):
-        """Initialize the agent with Google GenAI client."""
+    def __init__(self, max_tokens_generate: int = MAX_TOKENS_GENERATE,
+                 max_tokens_regenerate: int = MAX_TOKENS_REGENERATE,
+                 semantic_cache=None, route_simple_to_groq: bool = False,
+                 route_simple_feedback: bool = False):
+        """
+        Initialize the agent with Google GenAI client.
+
+        Args:
+            max_tokens_generate: Output token cap for generate()
+            max_tokens_regenerate: Output token cap for regenerate_with_feedback()
+            semantic_cache: Optional agents.semantic_cache.SemanticCache consulted
+                after the exact-match cache misses
+            route_simple_to_groq: Send low-complexity generate()/agenerate() requests
+                to the cheaper Groq model instead of Gemini
+            route_simple_feedback: Send short, local adjustment requests to
+                GROQ_FAST_MODEL instead of GROQ_MODEL
+        """
         self.model_name = "gemini-3-flash-preview"
+        self.max_tokens_generate = max_tokens_generate
+        self.max_tokens_regenerate = max_tokens_regenerate
+        self.semantic_cache = semantic_cache
+        self.route_simple_to_groq = route_simple_to_groq
+        self.route_simple_feedback = route_simple_feedback
         self.client = self._setup_llm()
 
     def _setup_llm(self):
-        """Setup Google GenAI client."""
-        api_key = os.getenv("GEMINI_API_KEY")
-        if not api_key:
-            raise ValueError("GEMINI_API_KEY not found in .env")
-        return genai.Client(api_key=api_key)
+        """Setup Google GenAI client (shared across agent instances)."""
+        return _get_gemini_client()
 
-    def generate(self, user_context: str, user_goal: str):
+    def generate(self, user_context: str, user_goal: str, on_chunk=None):
         """
         Generate learning path based on user baseline and objective.
         Single-step process: path generation only.
@@ -39,152 +657,547 @@ class LearningPathAgent:
         Args:
             user_context: The user's current baseline (expertise, experience, knowledge)
             user_goal: The practical objective the user wants to achieve
+            on_chunk: Optional callable receiving streamed text in ~50ms batches (e.g. to drive a UI)
 
         Returns:
             Dictionary with learning path
         """
-        print(f"\n{'='*80}")
-        print(f"LEARNING PATH AGENT (GEMINI)")
-        print(f"{'='*80}")
-        print(f"Baseline: {user_context}")
-        print(f"Objective: {user_goal}\n")
+        contents, generate_content_config, cache_key = self._build_generate_request(user_context, user_goal)
 
-        print(f"🤖 Generating learning path with Gemini Flash...\n")
+        cached = _get_cached_response(cache_key)
+        if cached is not None:
+            return cached
 
-        system_prompt = """You are an expert instructional designer. Generate a learning journey that bridges the gap between a learner's baseline and their objective.
+        # An identical request already running answers this one too
+        future, is_leader = _join_inflight(cache_key)
+        if not is_leader:
+            logger.info("Joining identical in-flight learning path request")
+            try:
+                return _coalesced_result(future.result())
+            except _InflightAbandoned:
+                return self.generate(user_context, user_goal, on_chunk)
 
-## INPUTS
-1. **User's Baseline**: Current knowledge, skills, and experience.
-2. **User's Objective**: The specific outcome they want to achieve.
+        try:
+            result = self._generate_uncached(
+                contents, generate_content_config, cache_key, user_context, user_goal, on_chunk
+            )
+        except Exception as e:
+            _finish_inflight(cache_key, future, error=e)
+            raise
+        except BaseException:
+            _abandon_inflight(cache_key, future)
+            raise
+        _finish_inflight(cache_key, future, result=result)
+        return result
+
+    def _generate_uncached(self, contents, generate_content_config, cache_key: str,
+                           user_context: str, user_goal: str, on_chunk=None):
+        """Semantic-cache lookup and, on a miss, the Gemini call behind generate()."""
+        cached, query_embedding = self._semantic_lookup(user_context, user_goal)
+        if cached is not None:
+            return cached
 
-## YOUR TASK
-Create a lean curriculum of **Minimum Viable Knowledge (MVK)**—only what's essential to achieve the objective.
+        try:
+            start_time = time.time()
 
-## DESIGN PRINCIPLES
+            if self._route_model(user_context, user_goal) == GROQ_MODEL:
+                logger.info("Routing simple request to %s", GROQ_MODEL)
+                response = self._call_groq(
+                    GROQ_GENERATE_SYSTEM_PROMPT, self._generate_user_prompt(user_context, user_goal),
+                    self.max_tokens_generate, temperature=0.0,
+                )
+                result = self._finalize_groq_generation(response, time.time() - start_time)
+            else:
+                full_response, usage_metadata, truncated = self._run_generation(
+                    contents, generate_content_config, on_chunk
+                )
+                if truncated:
+                    generate_content_config = self._double_output_budget(generate_content_config)
+                    full_response, usage_metadata, truncated = self._run_generation(
+                        contents, generate_content_config, on_chunk
+                    )
+
+                result = self._finalize_generation(full_response, usage_metadata, time.time() - start_time)
+            _store_cached_response(cache_key, result)
+            self._semantic_store(query_embedding, user_goal, result)
+            return result
 
-1. **Gap-Focused**: Only include what closes the baseline→objective gap. Exclude what they already know.
-2. **Narrative Flow**: Design chapters like episodes in a series—each one ends with a cliffhanger that the next chapter resolves. The learner should feel momentum, not isolated modules.
-3. **Progressive**: Each chapter builds on the previous. The artifact/skill from Chapter N becomes the foundation for Chapter N+1.
-4. **Outcome-Oriented**: Focus on what user CAN DO after each chapter, not abstract knowledge.
-5. **Lean**: 2-8 chapters. Prefer fewer, deeper chapters over many shallow ones.
+        except Exception as e:
+            logger.error("Learning path generation failed: %s", e)
+            raise e
 
-## STRICT EXCLUSION
-Only include a chapter if the learner CANNOT achieve the objective without it. Exclude:
-- Best practices (unless essential for basic functionality)
-- Scope creep beyond the stated objective
-- Topics requiring external resources outside learner's control
-- Historical context or "why it was created" unless directly relevant
+    async def agenerate(self, user_context: str, user_goal: str, on_chunk=None):
+        """
+        Async variant of generate() using the Gemini aio client.
 
-## OUTPUT FORMAT
-Return a single valid JSON object:
+        Lets callers overlap several generations on one event loop instead of
+        blocking a thread per request for the whole stream.
 
-{
-  "journey": {
-    "title": "Transformation arc (e.g., 'From X to Y' or 'Becoming a Z')",
-    "destination": "One sentence: what they'll be able to do/create/understand at the end"
-  },
-  "chapters": [
-    {
-      "chapter": 1,
-      "title": "Achievement-focused title (what you'll accomplish)",
-      "outcome": "The concrete capability gained—what you can now build, do, or solve. Vary phrasing naturally.",
-      "unlocks": "The natural next question or limitation this creates—the hook into the next chapter (null for final)",
-      "concepts": ["Core concept with brief context", "Another essential concept"],
-      "practice": ["Specific hands-on task with clear deliverable", "Another practical exercise"]
-    }
-  ]
-}
+        Args:
+            user_context: The user's current baseline (expertise, experience, knowledge)
+            user_goal: The practical objective the user wants to achieve
+            on_chunk: Optional callable receiving streamed text in ~50ms batches (e.g. to drive a UI)
 
-## WRITING STYLE
-- Write directly to user (second person: "you", not "the learner")
-- Vary sentence structure and vocabulary—avoid repetitive patterns across chapters
-- Use action verbs: build, create, configure, deploy, debug, integrate, etc.
-- Be specific: name technologies, patterns, or artifacts the learner will work with
-- Outcomes should feel like achievements, not checkboxes
+        Returns:
+            Dictionary with learning path
+        """
+        contents, generate_content_config, cache_key = self._build_generate_request(user_context, user_goal)
 
-## RULES
-- Output ONLY JSON. No markdown fences, no explanation.
-- Every chapter must have clear, non-redundant purpose.
-- Concepts: 2-4 essential ideas per chapter (quality over quantity)
-- Practice: 1-3 concrete activities that produce tangible results"""
+        cached = _get_cached_response(cache_key)
+        if cached is not None:
+            return cached
 
-        user_prompt = f"""<user_input>
-User Baseline: {user_context}
-User Objective: {user_goal}
-</user_input>"""
+        # An identical request already running answers this one too
+        future, is_leader = _join_inflight(cache_key)
+        if not is_leader:
+            logger.info("Joining identical in-flight learning path request")
+            try:
+                return _coalesced_result(await asyncio.wrap_future(future))
+            except _InflightAbandoned:
+                return await self.agenerate(user_context, user_goal, on_chunk)
 
         try:
-            contents = [
-                types.Content(
-                    role="user",
-                    parts=[
-                        types.Part.from_text(text=f"{system_prompt}\n\n{user_prompt}"),
-                    ],
-                ),
-            ]
-            
-            generate_content_config = types.GenerateContentConfig(
-                temperature=0.0,
-                top_p=1.0,
-                max_output_tokens=8000,
+            result = await self._agenerate_uncached(
+                contents, generate_content_config, cache_key, user_context, user_goal, on_chunk
             )
+        except Exception as e:
+            _finish_inflight(cache_key, future, error=e)
+            raise
+        except BaseException:
+            _abandon_inflight(cache_key, future)
+            raise
+        _finish_inflight(cache_key, future, result=result)
+        return result
+
+    async def _agenerate_uncached(self, contents, generate_content_config, cache_key: str,
+                                  user_context: str, user_goal: str, on_chunk=None):
+        """Async counterpart of _generate_uncached()."""
+        cached, query_embedding = await asyncio.to_thread(self._semantic_lookup, user_context, user_goal)
+        if cached is not None:
+            return cached
 
-            
+        try:
             start_time = time.time()
-            usage_metadata = None
-            
-            full_response = ""
-            for chunk in self.client.models.generate_content_stream(
-                model=self.model_name,
-                contents=contents,
-                config=generate_content_config,
-            ):
-                if chunk.text:
-                    full_response += chunk.text
-                if chunk.usage_metadata:
-                    usage_metadata = chunk.usage_metadata
-            
-            end_time = time.time()
-            duration = end_time - start_time
-            
-            print("\n" + "─" * 80 + "\n")
-            
-            if usage_metadata:
-                input_tokens = usage_metadata.prompt_token_count
-                output_tokens = usage_metadata.candidates_token_count
-                total_tokens = usage_metadata.total_token_count
-                print(f"📊 Stats:")
-                print(f"   ⏱️  Time: {duration:.2f}s")
-                print(f"   🔢 Tokens: {total_tokens:,} (In: {input_tokens:,}, Out: {output_tokens:,})\n")
+
+            if self._route_model(user_context, user_goal) == GROQ_MODEL:
+                logger.info("Routing simple request to %s", GROQ_MODEL)
+                response = await self._acall_groq(
+                    GROQ_GENERATE_SYSTEM_PROMPT, self._generate_user_prompt(user_context, user_goal),
+                    self.max_tokens_generate, temperature=0.0,
+                )
+                result = self._finalize_groq_generation(response, time.time() - start_time)
             else:
-                print(f"📊 Stats:")
-                print(f"   ⏱️  Time: {duration:.2f}s")
-                print(f"   🔢 Tokens: Unknown\n")
-
-            learning_path = self._extract_json(full_response)
-
-            # Return token usage for logging
-            token_usage = None
-            if usage_metadata:
-                token_usage = {
-                    "prompt_tokens": usage_metadata.prompt_token_count,
-                    "completion_tokens": usage_metadata.candidates_token_count,
-                    "total_tokens": usage_metadata.total_token_count,
-                    "model_name": self.model_name
-                }
-
-            return {
-                "learning_path": learning_path,
-                "token_usage": token_usage
-            }
+                full_response, usage_metadata, truncated = await self._arun_generation(
+                    contents, generate_content_config, on_chunk
+                )
+                if truncated:
+                    generate_content_config = self._double_output_budget(generate_content_config)
+                    full_response, usage_metadata, truncated = await self._arun_generation(
+                        contents, generate_content_config, on_chunk
+                    )
+
+                result = self._finalize_generation(full_response, usage_metadata, time.time() - start_time)
+            _store_cached_response(cache_key, result)
+            await asyncio.to_thread(self._semantic_store, query_embedding, user_goal, result)
+            return result
+
+        except Exception as e:
+            logger.error("Learning path generation failed: %s", e)
+            raise e
+
+    async def generate_stream(self, user_context: str, user_goal: str):
+        """
+        Stream a learning path, yielding each chapter as soon as it is complete.
+
+        Lets a UI render the first chapter after roughly one chapter's worth of
+        tokens instead of waiting for the whole path.
+
+        Args:
+            user_context: The user's current baseline (expertise, experience, knowledge)
+            user_goal: The practical objective the user wants to achieve
+
+        Yields:
+            {"type": "chapter", "chapter": {...}} for each chapter in order, then
+            {"type": "complete", "learning_path": {...}, "token_usage": {...}}
+
+        Always streams from Gemini, whatever route_simple_to_groq says, so the
+        response cache is keyed on the Gemini model. Identical in-flight requests
+        are not coalesced: a joined caller would have to wait for the whole path,
+        which defeats streaming, so each stream makes its own call.
+        """
+        contents, generate_content_config, cache_key = self._build_generate_request(
+            user_context, user_goal, model=self.model_name
+        )
+
+        cached = _get_cached_response(cache_key)
+        if cached is None:
+            cached, query_embedding = await asyncio.to_thread(self._semantic_lookup, user_context, user_goal)
+        if cached is not None:
+            for chapter in cached["learning_path"].get("chapters", []):
+                yield {"type": "chapter", "chapter": chapter}
+            yield {"type": "complete", **cached}
+            return
+
+        try:
+            start_time = time.time()
+            emitted = 0
+
+            for attempt in range(2):
+                usage_metadata = None
+                finish_reason = None
+
+                parts = []
+                parser = _ChapterStreamParser()
+                seen = 0
+                async for chunk in await self.client.aio.models.generate_content_stream(
+                    model=self.model_name,
+                    contents=contents,
+                    config=generate_content_config,
+                ):
+                    if chunk.usage_metadata:
+                        usage_metadata = chunk.usage_metadata
+                    if chunk.candidates and chunk.candidates[0].finish_reason:
+                        finish_reason = chunk.candidates[0].finish_reason
+                    text = chunk.text
+                    if text:
+                        parts.append(text)
+                        for chapter in parser.feed(text):
+                            seen += 1
+                            # A truncated-output retry replays chapters already sent
+                            if seen > emitted:
+                                emitted += 1
+                                yield {"type": "chapter", "chapter": chapter}
+                        if parser.done:
+                            break
+
+                if finish_reason != types.FinishReason.MAX_TOKENS or attempt == 1:
+                    break
+                generate_content_config = self._double_output_budget(generate_content_config)
+
+            result = self._finalize_generation("".join(parts), usage_metadata, time.time() - start_time)
+            _store_cached_response(cache_key, result)
+            await asyncio.to_thread(self._semantic_store, query_embedding, user_goal, result)
+            yield {"type": "complete", **result}
 
         except Exception as e:
-            print(f"\n❌ Error: {e}")
+            logger.error("Learning path generation failed: %s", e)
             raise e
 
+    async def generate_many(self, pairs: list, concurrency: int = MAX_CONCURRENT_REQUESTS):
+        """
+        Generate learning paths for many (user_context, user_goal) pairs concurrently.
+
+        All requests are scheduled up front and awaited together; a semaphore
+        caps in-flight Gemini calls so the batch stays inside rate limits.
+
+        Args:
+            pairs: List of (user_context, user_goal) tuples
+            concurrency: Maximum number of simultaneous Gemini calls
+
+        Returns:
+            List of generate() results in the same order as pairs. A pair that
+            failed yields its exception instead, so one error doesn't sink the batch.
+        """
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def _one(pair):
+            async with semaphore:
+                return await self.agenerate(*pair)
+
+        return await asyncio.gather(*[_one(p) for p in pairs], return_exceptions=True)
+
+    def generate_batch(self, pairs: list, poll_interval: float = BATCH_POLL_INTERVAL):
+        """
+        Generate learning paths for many pairs through one Gemini Batch API job.
+
+        For non-interactive bulk work (e.g. pre-warming the response cache for
+        popular goals): all uncached requests go out as a single submission
+        billed at the batch discount, at the cost of minutes-to-hours latency.
+        Interactive traffic should use agenerate()/generate_many() instead.
+
+        Args:
+            pairs: List of (user_context, user_goal) tuples
+            poll_interval: Seconds between job status checks
+
+        Returns:
+            List of generate() results in the same order as pairs. A pair that
+            failed yields its exception instead, so one error doesn't sink the batch.
+        """
+        results = [None] * len(pairs)
+        pending = []  # (index, cache_key, request)
+        for i, (user_context, user_goal) in enumerate(pairs):
+            try:
+                contents, generate_content_config, cache_key = self._build_generate_request(
+                    user_context, user_goal, model=self.model_name
+                )
+            except PromptTooLargeError as e:
+                results[i] = e
+                continue
+            cached = _get_cached_response(cache_key)
+            if cached is not None:
+                results[i] = cached
+                continue
+            pending.append((i, cache_key, types.InlinedRequest(contents=contents, config=generate_content_config)))
+
+        if not pending:
+            return results
+
+        start_time = time.time()
+        job = self.client.batches.create(model=self.model_name, src=[request for _, _, request in pending])
+        logger.info("Submitted batch job %s with %d requests", job.name, len(pending))
+        while job.state.name not in _BATCH_DONE_STATES:
+            time.sleep(poll_interval)
+            job = self.client.batches.get(name=job.name)
+
+        if job.state.name != "JOB_STATE_SUCCEEDED":
+            error = RuntimeError(f"Batch job {job.name} ended in {job.state.name}")
+            for i, _, _ in pending:
+                results[i] = error
+            return results
+
+        duration = time.time() - start_time
+        for (i, cache_key, _), inlined in zip(pending, job.dest.inlined_responses):
+            if inlined.error:
+                results[i] = RuntimeError(f"Batch request failed: {inlined.error}")
+                continue
+            try:
+                result = self._finalize_generation(inlined.response.text, inlined.response.usage_metadata, duration)
+            except ValueError as e:
+                results[i] = e
+                continue
+            _store_cached_response(cache_key, result)
+            results[i] = result
+        return results
+
+    def _semantic_lookup(self, user_context: str, user_goal: str):
+        """
+        Best-effort semantic cache lookup; an embedding failure never blocks generation.
+
+        Returns:
+            Tuple of (cached result or None, query embedding or None)
+        """
+        if self.semantic_cache is None:
+            return None, None
+        try:
+            cached, query_embedding = self.semantic_cache.lookup(self.client, user_context, user_goal)
+        except Exception as e:
+            logger.warning("Semantic cache lookup failed: %s", e)
+            return None, None
+        if cached is not None:
+            logger.info("Semantic cache hit: returning stored learning path")
+        return cached, query_embedding
+
+    def _semantic_store(self, query_embedding, user_goal: str, result: dict):
+        """Store a fresh result in the semantic cache, if one is configured."""
+        if self.semantic_cache is None or query_embedding is None:
+            return
+        try:
+            self.semantic_cache.store(query_embedding, user_goal, result)
+        except Exception as e:
+            logger.warning("Semantic cache store failed: %s", e)
+
+    def _route_model(self, user_context: str, user_goal: str) -> str:
+        """Pick the model for a generation: Groq for simple requests when routing is enabled."""
+        if not self.route_simple_to_groq:
+            return self.model_name
+        if _request_complexity(user_context, user_goal) < ROUTE_COMPLEXITY_THRESHOLD:
+            return GROQ_MODEL
+        return self.model_name
+
+    def _generate_user_prompt(self, user_context: str, user_goal: str) -> str:
+        """The per-request user message for a generation."""
+        return f"""<user_input>
+User Baseline: {user_context}
+User Objective: {user_goal}
+</user_input>"""
+
+    def _build_generate_request(self, user_context: str, user_goal: str, model: str = None):
+        """
+        Build the Gemini contents, config and response cache key for a generation request.
+
+        Args:
+            user_context: The user's current baseline
+            user_goal: The user's objective
+            model: Model that will answer the request, for the cache key; defaults
+                to _route_model(). Callers that always use Gemini pass self.model_name.
+        """
+        logger.info(
+            "generate start: model=%s baseline_len=%d goal_len=%d",
+            self.model_name, len(user_context), len(user_goal),
+        )
+        logger.debug("Baseline: %s", user_context)
+        logger.debug("Objective: %s", user_goal)
+        _check_input_size(user_context, user_goal)
+
+        user_prompt = self._generate_user_prompt(user_context, user_goal)
+
+        contents = [
+            types.Content(
+                role="user",
+                parts=[
+                    types.Part.from_text(text=user_prompt),
+                ],
+            ),
+        ]
+
+        generate_content_config = _generate_config(self.max_tokens_generate)
+
+        # Keyed on the answering model so Gemini and Groq answers never mix, and on
+        # the normalized prompt so "K8s for backend devs " hits "k8s for backend devs"
+        if model is None:
+            model = self._route_model(user_context, user_goal)
+        system_prompt = GROQ_GENERATE_SYSTEM_PROMPT if model == GROQ_MODEL else GENERATE_SYSTEM_PROMPT
+        cache_key = _response_cache_key(
+            model, system_prompt, _normalize_input(user_prompt),
+            generate_content_config.temperature, generate_content_config.top_p,
+            generate_content_config.max_output_tokens,
+        )
+
+        return contents, generate_content_config, cache_key
+
+    def _run_generation(self, contents, generate_content_config, on_chunk=None):
+        """Stream only when a caller consumes chunks; otherwise make one blocking call."""
+        if on_chunk is None:
+            return self._generate_blocking(contents, generate_content_config)
+        return self._stream_generation(contents, generate_content_config, on_chunk)
+
+    async def _arun_generation(self, contents, generate_content_config, on_chunk=None):
+        """Async counterpart of _run_generation()."""
+        if on_chunk is None:
+            return await self._agenerate_blocking(contents, generate_content_config)
+        return await self._astream_generation(contents, generate_content_config, on_chunk)
+
+    def _generate_blocking(self, contents, generate_content_config):
+        """
+        Run one non-streaming Gemini generation.
+
+        Returns:
+            Tuple of (response text, usage metadata, whether the token cap cut it off)
+        """
+        response = self.client.models.generate_content(
+            model=self.model_name,
+            contents=contents,
+            config=generate_content_config,
+        )
+
+        return response.text or "", response.usage_metadata, self._hit_token_cap(response)
+
+    async def _agenerate_blocking(self, contents, generate_content_config):
+        """Async counterpart of _generate_blocking()."""
+        response = await self.client.aio.models.generate_content(
+            model=self.model_name,
+            contents=contents,
+            config=generate_content_config,
+        )
+
+        return response.text or "", response.usage_metadata, self._hit_token_cap(response)
+
+    def _hit_token_cap(self, response) -> bool:
+        """True if a complete (non-streamed) response stopped at the output token cap."""
+        return bool(response.candidates) and response.candidates[0].finish_reason == types.FinishReason.MAX_TOKENS
+
+    def _stream_generation(self, contents, generate_content_config, on_chunk=None):
+        """
+        Stream one Gemini generation, stopping once the JSON object closes.
+
+        Returns:
+            Tuple of (response text, usage metadata, whether the token cap cut it off)
+        """
+        usage_metadata = None
+        finish_reason = None
+
+        parts = []
+        scanner = _JsonObjectScanner()
+        batcher = _ChunkBatcher(on_chunk) if on_chunk is not None else None
+        for chunk in self.client.models.generate_content_stream(
+            model=self.model_name,
+            contents=contents,
+            config=generate_content_config,
+        ):
+            if chunk.usage_metadata:
+                usage_metadata = chunk.usage_metadata
+            if chunk.candidates and chunk.candidates[0].finish_reason:
+                finish_reason = chunk.candidates[0].finish_reason
+            # chunk.text re-joins the candidate parts on every access
+            text = chunk.text
+            if text:
+                parts.append(text)
+                if batcher is not None:
+                    batcher.add(text)
+                # Stop reading as soon as the learning path object is complete
+                if scanner.feed(text):
+                    break
+
+        if batcher is not None:
+            batcher.flush()
+        return "".join(parts), usage_metadata, finish_reason == types.FinishReason.MAX_TOKENS
+
+    async def _astream_generation(self, contents, generate_content_config, on_chunk=None):
+        """Async counterpart of _stream_generation()."""
+        usage_metadata = None
+        finish_reason = None
+
+        parts = []
+        scanner = _JsonObjectScanner()
+        batcher = _ChunkBatcher(on_chunk) if on_chunk is not None else None
+        async for chunk in await self.client.aio.models.generate_content_stream(
+            model=self.model_name,
+            contents=contents,
+            config=generate_content_config,
+        ):
+            if chunk.usage_metadata:
+                usage_metadata = chunk.usage_metadata
+            if chunk.candidates and chunk.candidates[0].finish_reason:
+                finish_reason = chunk.candidates[0].finish_reason
+            # chunk.text re-joins the candidate parts on every access
+            text = chunk.text
+            if text:
+                parts.append(text)
+                if batcher is not None:
+                    batcher.add(text)
+                # Stop reading as soon as the learning path object is complete
+                if scanner.feed(text):
+                    break
+
+        if batcher is not None:
+            batcher.flush()
+        return "".join(parts), usage_metadata, finish_reason == types.FinishReason.MAX_TOKENS
+
+    def _double_output_budget(self, generate_content_config):
+        """Return a copy of the config with twice the output token cap, for a truncated retry."""
+        budget = generate_content_config.max_output_tokens * 2
+        logger.warning("Response hit the output token cap, retrying with %d tokens", budget)
+        return generate_content_config.model_copy(update={"max_output_tokens": budget})
+
+    def _finalize_generation(self, full_response: str, usage_metadata, duration: float):
+        """Log stats, parse the streamed response and package token usage."""
+        token_usage = _pack_gemini_usage(usage_metadata, self.model_name)
+        if token_usage:
+            logger.info(
+                "Token usage (generate): time=%.2fs total=%s in=%s out=%s",
+                duration, token_usage["total_tokens"],
+                token_usage["prompt_tokens"], token_usage["completion_tokens"],
+            )
+        else:
+            logger.info("Token usage (generate): time=%.2fs total=unknown", duration)
+
+        # Schema-constrained output parses directly; no fence stripping or repair
+        try:
+            learning_path = LearningPath.model_validate_json(full_response).model_dump()
+        except ValidationError as e:
+            logger.error("Learning path failed schema validation: %s", e)
+            logger.error("Response (first 500 chars): %s", full_response[:500])
+            raise ValueError(f"Invalid learning path response: {str(e)}")
+
+        return {
+            "learning_path": learning_path,
+            "token_usage": token_usage
+        }
+
     def regenerate_with_feedback(self, original_path: dict, user_feedback: str, learning_goal: str):
         """
-        Regenerate learning path based on user feedback using Groq llama-3.3-70b-versatile.
+        Regenerate learning path based on user feedback using Groq llama-3.3-70b-versatile
+        (or llama-3.1-8b-instant for simple edits when route_simple_feedback is set).
         The original path is treated as the ideal baseline - only adjust based on feedback.
 
         Args:
@@ -195,188 +1208,258 @@ User Objective: {user_goal}
         Returns:
             Dictionary with adjusted learning path (same format as original)
         """
-        from groq import Groq
-        
-        groq_api_key = os.getenv("GROQ_API_KEY")
-        if not groq_api_key:
-            raise ValueError("GROQ_API_KEY not found in .env")
-        
-        groq_client = Groq(api_key=groq_api_key)
-        
-        print(f"\n{'='*80}")
-        print(f"LEARNING PATH ADJUSTMENT (GROQ LLAMA 3.3 70B)")
-        print(f"{'='*80}")
-        print(f"Feedback: {user_feedback}\n")
-
-        original_path_json = json.dumps(original_path, indent=2)
-
-        system_prompt = """You are a curriculum refinement specialist. ADJUST the learning path based on user feedback.
+        user_prompt, cache_key, model, max_tokens = self._build_regenerate_request(
+            original_path, user_feedback, learning_goal
+        )
 
-## RULES
-1. The original path is HIGH QUALITY—make MINIMAL changes
-2. Only adjust what the feedback specifically requests
-3. Preserve the narrative flow and chapter dependencies
-4. Do NOT add/remove chapters unless explicitly requested
-
-## OUTPUT FORMAT
-Return ONLY valid JSON:
+        cached = _get_cached_response(cache_key)
+        if cached is not None:
+            return cached
 
-{
-  "journey": {
-    "title": "Transformation arc",
-    "destination": "What they'll be able to do at the end"
-  },
-  "chapters": [
-    {
-      "chapter": 1,
-      "title": "Achievement-focused title",
-      "outcome": "Concrete capability gained—vary phrasing naturally across chapters",
-      "unlocks": "The hook into the next chapter—what question or limitation this creates (null for final)",
-      "concepts": ["Core concept", "Another concept"],
-      "practice": ["Hands-on task with deliverable", "Another exercise"]
-    }
-  ]
-}
-
-## WRITING STYLE
-- Write directly to user (second person: "you")
-- Vary sentence structure—avoid repetitive patterns
-- Outcomes should feel like achievements, not checkboxes
+        try:
+            response = self._call_groq(REGENERATE_SYSTEM_PROMPT, user_prompt, max_tokens, model=model)
+            result = self._finalize_regeneration(response, model)
+            _store_cached_response(cache_key, result)
+            return result
 
-## RULES
-- Output ONLY JSON. No markdown fences, no explanation.
-- Maintain sequential chapter ordering (1, 2, 3, ...)"""
+        except Exception as e:
+            logger.error("Learning path adjustment failed: %s", e)
+            raise e
 
-        user_prompt = f"""## ORIGINAL LEARNING PATH (treat as ideal baseline):
-```json
-{original_path_json}
-```
+    async def aregenerate_with_feedback(self, original_path: dict, user_feedback: str, learning_goal: str):
+        """
+        Async variant of regenerate_with_feedback() using the AsyncGroq client.
 
-## LEARNING GOAL:
-{learning_goal}
+        Args:
+            original_path: The original learning path (the ideal starting point)
+            user_feedback: User's feedback on what to adjust
+            learning_goal: The user's learning goal
 
-## USER FEEDBACK (apply these adjustments):
-{user_feedback}
+        Returns:
+            Dictionary with adjusted learning path (same format as original)
+        """
+        user_prompt, cache_key, model, max_tokens = self._build_regenerate_request(
+            original_path, user_feedback, learning_goal
+        )
 
-Adjust the learning path based on the feedback while preserving as much of the original structure as possible."""
+        cached = _get_cached_response(cache_key)
+        if cached is not None:
+            return cached
 
         try:
-            print(f"🔄 Adjusting learning path with Llama 3.3 70B...\n")
-            
-            response = groq_client.chat.completions.create(
-                model="llama-3.3-70b-versatile",
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_prompt}
-                ],
-                temperature=0.1,
-                max_tokens=8000,
-                top_p=1,
-                stream=False
+            response = await self._acall_groq(
+                REGENERATE_SYSTEM_PROMPT, user_prompt, max_tokens, model=model
             )
-
-            content = response.choices[0].message.content
-            
-            if hasattr(response, 'usage'):
-                usage = response.usage
-                print(f"📊 Stats:")
-                print(f"   🔢 Tokens: {usage.total_tokens:,} (In: {usage.prompt_tokens:,}, Out: {usage.completion_tokens:,})\n")
-
-            adjusted_path = self._extract_json(content)
-
-            print(f"✅ Learning path adjusted: {len(adjusted_path.get('chapters', []))} chapters\n")
-
-            # Return token usage for logging
-            token_usage = None
-            if hasattr(response, 'usage'):
-                usage = response.usage
-                token_usage = {
-                    "prompt_tokens": usage.prompt_tokens,
-                    "completion_tokens": usage.completion_tokens,
-                    "total_tokens": usage.total_tokens,
-                    "model_name": "llama-3.3-70b-versatile"
-                }
-
-            return {
-                "learning_path": adjusted_path,
-                "token_usage": token_usage
-            }
+            result = self._finalize_regeneration(response, model)
+            _store_cached_response(cache_key, result)
+            return result
 
         except Exception as e:
-            print(f"\n❌ Adjustment Error: {e}")
+            logger.error("Learning path adjustment failed: %s", e)
             raise e
 
-    def _extract_json(self, text: str):
-        """Extract JSON from LLM response wrapped in markdown."""
-        text = text.strip()
+    def _route_feedback_model(self, user_feedback: str) -> str:
+        """Pick the Groq model for an adjustment: the small one for simple edits when routing is enabled."""
+        if self.route_simple_feedback and _is_simple_feedback(user_feedback):
+            return GROQ_FAST_MODEL
+        return GROQ_MODEL
+
+    def _build_regenerate_request(self, original_path: dict, user_feedback: str, learning_goal: str):
+        """Build the Groq user message, response cache key, routed model and output budget for an adjustment request."""
+        model = self._route_feedback_model(user_feedback)
+        logger.info(
+            "regenerate start: model=%s chapters=%d feedback_len=%d",
+            model, len(original_path.get('chapters', [])), len(user_feedback),
+        )
+        logger.debug("Feedback: %s", user_feedback)
+        _check_input_size(learning_goal, user_feedback)
+
+        # Compact: indentation would add ~25-40% input tokens the model doesn't need
+        original_path_json = orjson.dumps(original_path).decode()
+
+        # Sized to the path being adjusted; a truncated answer is retried with double
+        estimate = len(original_path_json) / CHARS_PER_TOKEN
+        max_tokens = min(
+            max(int(REGENERATE_BUDGET_FACTOR * estimate), REGENERATE_MIN_TOKENS),
+            self.max_tokens_regenerate,
+        )
+
+        # Ordered from most to least stable across feedback rounds (goal, then
+        # path, then feedback) so repeat calls share the longest cached prefix
+        user_prompt = f"""## LEARNING GOAL:
+{learning_goal}
 
-        start_marker = "```json"
-        end_marker = "```"
+## ORIGINAL LEARNING PATH (treat as ideal baseline):
+```json
+{original_path_json}
+```
 
-        start_idx = text.find(start_marker)
-        if start_idx == -1:
-            start_marker = "```"
-            start_idx = text.find(start_marker)
-            if start_idx == -1:
-                try:
-                    return json.loads(text)
-                except json.JSONDecodeError as e:
-                    print(f"❌ JSON parsing error: {e}")
-                    print(f"Response (first 500 chars): {text[:500]}")
-                    raise ValueError(f"Invalid JSON response: {str(e)}")
+## USER FEEDBACK (apply these adjustments):
+{user_feedback}"""
 
-        end_idx = text.find(end_marker, start_idx + len(start_marker))
+        cache_key = _response_cache_key(
+            model, REGENERATE_SYSTEM_PROMPT, user_prompt,
+            0.1, max_tokens,
+        )
 
-        if end_idx == -1:
-            raise ValueError(f"No closing '```' found for JSON block")
+        return user_prompt, cache_key, model, max_tokens
 
-        json_str = text[start_idx + len(start_marker) : end_idx].strip()
+    def _call_groq(self, system_prompt: str, user_prompt: str, max_tokens: int, temperature: float = 0.1,
+                   model: str = GROQ_MODEL):
+        """Groq JSON-mode completion, retried once with a doubled cap if the answer was cut off."""
+        groq_client = _get_groq_client()
+        for attempt in range(2):
+            response = groq_client.chat.completions.create(
+                **self._groq_params(system_prompt, user_prompt, max_tokens, temperature, model)
+            )
+            if response.choices[0].finish_reason != "length" or attempt == 1:
+                return response
+            max_tokens *= 2
+            logger.warning("Response hit the output token cap, retrying with %d tokens", max_tokens)
+
+    async def _acall_groq(self, system_prompt: str, user_prompt: str, max_tokens: int, temperature: float = 0.1,
+                          model: str = GROQ_MODEL):
+        """Async counterpart of _call_groq()."""
+        groq_client = _get_async_groq_client()
+        for attempt in range(2):
+            response = await groq_client.chat.completions.create(
+                **self._groq_params(system_prompt, user_prompt, max_tokens, temperature, model)
+            )
+            if response.choices[0].finish_reason != "length" or attempt == 1:
+                return response
+            max_tokens *= 2
+            logger.warning("Response hit the output token cap, retrying with %d tokens", max_tokens)
+
+    def _groq_params(self, system_prompt: str, user_prompt: str, max_tokens: int, temperature: float,
+                     model: str) -> dict:
+        """Groq chat completion parameters."""
+        return {
+            "model": model,
+            "messages": [
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": user_prompt}
+            ],
+            "temperature": temperature,
+            "max_tokens": max_tokens,
+            "top_p": 1,
+            "stream": False,
+            "response_format": {"type": "json_object"},
+        }
+
+    def _finalize_groq_generation(self, response, duration: float):
+        """Log stats, parse and schema-check a routed Groq generation, and package token usage."""
+        token_usage = _pack_groq_usage(getattr(response, 'usage', None), GROQ_MODEL)
+        if token_usage:
+            logger.info(
+                "Token usage (generate): time=%.2fs total=%d in=%d out=%d",
+                duration, token_usage["total_tokens"],
+                token_usage["prompt_tokens"], token_usage["completion_tokens"],
+            )
 
+        # Groq has no response schema, so validate against it after parsing
         try:
-            return json.loads(json_str)
-        except json.JSONDecodeError as e:
-            print(f"❌ JSON parsing error: {e}")
-            print(f"  Attempting to repair JSON...")
+            learning_path = LearningPath.model_validate(
+                self._extract_json(response.choices[0].message.content)
+            ).model_dump()
+        except ValidationError as e:
+            logger.error("Learning path failed schema validation: %s", e)
+            raise ValueError(f"Invalid learning path response: {str(e)}")
+
+        return {
+            "learning_path": learning_path,
+            "token_usage": token_usage
+        }
+
+    def _finalize_regeneration(self, response, model: str):
+        """Log stats, parse the Groq response and package token usage."""
+        content = response.choices[0].message.content
+
+        token_usage = _pack_groq_usage(getattr(response, 'usage', None), model)
+        if token_usage:
+            logger.info(
+                "Token usage (regenerate): total=%d in=%d out=%d",
+                token_usage["total_tokens"], token_usage["prompt_tokens"], token_usage["completion_tokens"],
+            )
 
-            try:
-                import re
-                repaired = re.sub(r',\s*}', '}', json_str)
-                repaired = re.sub(r',\s*]', ']', repaired)
+        adjusted_path = self._extract_json(content)
 
-                result = json.loads(repaired)
-                print(f"  ✅ JSON repaired successfully")
-                return result
-            except:
-                print(f"  ❌ Repair failed")
-                raise ValueError(f"Invalid JSON in code block: {str(e)}")
+        logger.info("Learning path adjusted: %d chapters", len(adjusted_path.get('chapters', [])))
 
+        return {
+            "learning_path": adjusted_path,
+            "token_usage": token_usage
+        }
 
-def print_learning_path(path: dict):
-    """Pretty print learning path."""
-    print(f"\n{'='*80}")
-    print(f"LEARNING JOURNEY")
-    print(f"{'='*80}\n")
+    def _extract_json(self, text: str):
+        """Parse the Groq JSON-mode response, falling back to markdown extraction and repair."""
+        text = text.strip()
 
-    journey = path.get('journey', {})
-    print(f"🎯 {journey.get('title', 'N/A')}")
-    print(f"   {journey.get('destination', 'N/A')}\n")
+        # Fast path: JSON mode returns a bare object
+        try:
+            return orjson.loads(text)
+        except orjson.JSONDecodeError as e:
+            parse_error = e
+
+        # Single pass over ```json / ``` fences; a missing closing fence keeps the rest
+        _, fence, rest = text.partition("```")
+        if fence:
+            json_str = rest.removeprefix("json").partition("```")[0].strip()
+            try:
+                return orjson.loads(json_str)
+            except orjson.JSONDecodeError as e:
+                parse_error = e
+        else:
+            json_str = text
+
+        # Handles trailing commas, unquoted keys and truncated output
+        logger.warning("JSON parsing error: %s; attempting repair", parse_error)
+        result = json_repair.loads(json_str)
+        if not isinstance(result, dict):
+            logger.error("JSON repair failed")
+            logger.error("Response (first 500 chars): %s", text[:500])
+            raise ValueError(f"Invalid JSON response: {str(parse_error)}")
 
-    print(f"{'─'*80}")
-    print(f"CHAPTERS ({len(path.get('chapters', []))} total):")
-    print(f"{'─'*80}")
+        logger.info("JSON repaired successfully")
+        return result
 
-    for chapter in path.get('chapters', []):
-        print(f"\n[Chapter {chapter['chapter']}] {chapter['title']}")
-        print(f"  ✓ Outcome: {chapter['outcome']}")
-        print(f"  🧠 Concepts: {chapter.get('concepts', [])}")
-        print(f"  🔧 Practice: {chapter.get('practice', [])}")
-        print(f"  → Unlocks: {chapter.get('unlocks', 'N/A')}")
 
-    print(f"\n{'='*80}\n")
+def print_learning_path(path: dict):
+    """Pretty print learning path (skipped unless INFO logging is enabled)."""
+    if not logger.isEnabledFor(logging.INFO):
+        return
+
+    journey = path.get('journey', {})
+    chapters = path.get('chapters', [])
+
+    # Assembled first and written once rather than one print per line
+    lines = [
+        f"\n{'='*80}",
+        "LEARNING JOURNEY",
+        f"{'='*80}\n",
+        f"🎯 {journey.get('title', 'N/A')}",
+        f"   {journey.get('destination', 'N/A')}\n",
+        f"{'─'*80}",
+        f"CHAPTERS ({len(chapters)} total):",
+        f"{'─'*80}",
+    ]
+
+    for chapter in chapters:
+        lines += [
+            f"\n[Chapter {chapter['chapter']}] {chapter['title']}",
+            f"  ✓ Outcome: {chapter['outcome']}",
+            f"  🧠 Concepts: {chapter.get('concepts', [])}",
+            f"  🔧 Practice: {chapter.get('practice', [])}",
+            f"  → Unlocks: {chapter.get('unlocks', 'N/A')}",
+        ]
+
+    lines.append(f"\n{'='*80}\n")
+    sys.stdout.write("\n".join(lines) + "\n")
 
 
 def main():
     """Main function with test inputs."""
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
     print("\n" + "="*80)
     print("LEARNING PATH GENERATOR (GEMINI)")
     print("="*80)
@@ -402,14 +1485,13 @@ def main():
 
         output_file = "LPgemini.json"
 
-        with open(output_file, "w") as f:
-            json.dump({
-                "input": {
-                    "user_baseline": user_context,
-                    "user_objective": user_goal
-                },
-                "learning_path": learning_path
-            }, f, indent=2)
+        Path(output_file).write_bytes(orjson.dumps({
+            "input": {
+                "user_baseline": user_context,
+                "user_objective": user_goal
+            },
+            "learning_path": learning_path
+        }, option=orjson.OPT_INDENT_2))
 
         print(f"✅ Results saved to: {output_file}\n")
 
@@ -420,11 +1502,13 @@ def main():
 
 
 if __name__ == "__main__":
-    if not os.path.exists(".env"):
-        print("\n⚠️  No .env file found!")
-        print("Create .env with:")
+    # Keys may come from real env vars (containers) or from an optional .env
+    _load_env()
+    if not os.environ.get("GEMINI_API_KEY"):
+        print("\n⚠️  GEMINI_API_KEY is not set!")
+        print("Export it or create .env with:")
         print("  GEMINI_API_KEY=your_key")
         print("  GROQ_API_KEY=your_key")
-        exit(1)
+        sys.exit(1)
 
     main()
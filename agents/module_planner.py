@@ -8,84 +8,86 @@ Supports two models:
 - Groq GPT-OSS 120B
 """
 
+import asyncio
+import copy
+import functools
+import hashlib
+import logging
 import time
 import os
-import json
+import re
+import sys
+import httpx
 from dotenv import load_dotenv
-from google import genai
-from google.genai import types
-from groq import Groq
 import json_repair
+import orjson
+from typing import List
+from pydantic import BaseModel
 
-load_dotenv()
-
-
-class ModulePlannerAgent:
-    """
-    Module planner that breaks down high-level modules into atomic micro-lessons.
-    """
-
-    def __init__(self, model_provider: str = "gemini"):
-        """
-        Initialize the agent with specified model provider.
-
-        Args:
-            model_provider: Either "gemini" or "groq"
-        """
-        self.model_provider = model_provider.lower()
-
-        if self.model_provider == "gemini":
-            self.model_name = "gemini-3-flash-preview"
-            self.client = self._setup_gemini()
-        elif self.model_provider == "groq":
-            self.model_name = "openai/gpt-oss-120b"
-            self.client = self._setup_groq()
-        else:
-            raise ValueError(f"Unknown model provider: {model_provider}. Use 'gemini' or 'groq'")
-
-    def _setup_gemini(self):
-        """Setup Google GenAI client."""
-        api_key = os.getenv("GEMINI_API_KEY")
-        if not api_key:
-            raise ValueError("GEMINI_API_KEY not found in .env")
-        return genai.Client(api_key=api_key)
-
-    def _setup_groq(self):
-        """Setup Groq client."""
-        api_key = os.getenv("GROQ_API_KEY")
-        if not api_key:
-            raise ValueError("GROQ_API_KEY not found in .env")
-        return Groq(api_key=api_key)
+logger = logging.getLogger(__name__)
 
-    def plan_module(
-        self,
-        user_baseline: str,
-        user_objective: str,
-        current_module: dict,
-        acquired_knowledge_history: list = None
-    ):
-        """
-        Break down a high-level module into atomic micro-lessons.
+# Optional Rust-backed repair (pip install repairjson); same loads() contract,
+# much faster on long malformed responses. Only reached after a strict parse
+# failed, so json_repair is told not to retry json.loads itself.
+try:
+    import repairjson
+    _repair_loads = repairjson.loads
+except ImportError:
+    _repair_loads = functools.partial(json_repair.loads, skip_json_loads=True)
 
-        Args:
-            user_baseline: The user's current knowledge and skills
-            user_objective: The specific goal the user wants to achieve
-            current_module: The module to break down (from learning path)
-            acquired_knowledge_history: List of competencies from previous modules
-
-        Returns:
-            Dictionary with lesson plan following URAC framework
-        """
-        if acquired_knowledge_history is None:
-            acquired_knowledge_history = []
-
-        print(f"\n{'='*80}")
-        print(f"MODULE PLANNER AGENT ({self.model_provider.upper()})")
-        print(f"{'='*80}")
-        print(f"Module: {current_module.get('title', 'N/A')}")
-        print(f"Provider: {self.model_name}\n")
+load_dotenv()
 
-        system_prompt = """**Role**
+# Markdown code fence around the JSON; group 2 is empty when the fence is unclosed
+_FENCE_RE = re.compile(r"```(?:json)?(.*?)(```|$)", re.DOTALL)
+
+# Default number of learning paths process_many_learning_paths() plans at once
+MAX_CONCURRENT_PATHS = 4
+
+# 429/5xx and dropped connections are retried by the SDKs with exponential
+# backoff, so one transient failure doesn't abort a long curriculum
+LLM_MAX_ATTEMPTS = 5
+RETRY_INITIAL_DELAY = 1.0
+RETRY_MAX_DELAY = 30.0
+
+# Sampling for every lesson plan request; also part of the plan cache key
+PLAN_TEMPERATURE = 0.0
+PLAN_TOP_P = 1.0
+
+# Plans run well under 4k output tokens, so requests start at a tight cap and
+# only a truncated response is retried with the cap doubled, up to the
+# provider ceiling
+PLAN_MAX_OUTPUT_TOKENS = 4096
+GEMINI_MAX_OUTPUT_TOKENS = 16000
+GROQ_MAX_OUTPUT_TOKENS = 8000
+
+# Keep-alive pool shared by every request of a client, so calls reuse TLS
+HTTP_MAX_CONNECTIONS = 64
+HTTP_MAX_KEEPALIVE = 32
+
+# In-process memo of finished plans keyed by a hash of everything that shapes
+# the response (model, sampling, prompts), so retries and re-runs of the same
+# module skip the LLM. Bump PLAN_CACHE_VERSION when the output format changes.
+PLAN_CACHE_SIZE = 128
+PLAN_CACHE_VERSION = 1
+_PLAN_CACHE = {}
+
+# Fan-out mode: the outline call returns everything except the URAC blueprints,
+# which are then written by one parallel call per lesson
+OUTLINE_INSTRUCTIONS = """
+Output ONLY the outline of the module: the same JSON object, but each lesson_plan entry
+has just "sequence" and "topic" (no "urac_blueprint"). The blueprints are written separately."""
+
+BLUEPRINT_INSTRUCTIONS = """
+Module outline (lessons in order):
+{outline}
+
+Write the URAC blueprint for lesson {sequence} only: "{topic}".
+Output a single JSON object with exactly the keys "understand", "retain", "apply" and "connect"."""
+
+
+# Static system prompt, kept byte-identical across calls so the provider's
+# implicit prefix cache can reuse it for every module of a curriculum
+SYSTEM_PROMPT = """**Role**
 You are an Expert Curriculum Architect. Your role is to design lesson blueprints for a "Mastery Engine" that will execute them.
 
 **Design Principle:**
@@ -147,255 +149,693 @@ You must output a single valid JSON object following this schema:
 ```
 """
 
-        acquired_knowledge_str = "\n".join([f"- {comp}" for comp in acquired_knowledge_history]) if acquired_knowledge_history else "None (this is the first module)"
-        chapter_num = current_module.get('chapter')
-        title = current_module.get('title')
-        outcome = current_module.get('outcome')
-        concepts = current_module.get('concepts')
-        practice = current_module.get('practice')
-        unlocks = current_module.get('unlocks')
 
-        user_prompt = f"""<user_input>
-User Baseline: {user_baseline}
+def _http_limits() -> httpx.Limits:
+    """Connection pool limits for the planner's HTTP clients."""
+    return httpx.Limits(max_connections=HTTP_MAX_CONNECTIONS, max_keepalive_connections=HTTP_MAX_KEEPALIVE)
+
+
+def _gemini_truncated(response) -> bool:
+    """Whether a Gemini response stopped at max_output_tokens."""
+    from google.genai import types
+
+    return bool(response.candidates) and response.candidates[0].finish_reason == types.FinishReason.MAX_TOKENS
+
+
+def _raise_output_cap(truncated: bool, max_tokens: int, ceiling: int):
+    """Doubled output cap for retrying a truncated response, or None to keep the response."""
+    if not truncated or max_tokens >= ceiling:
+        return None
+    logger.warning("Lesson plan hit the %d token output cap, retrying with a larger cap", max_tokens)
+    return min(max_tokens * 2, ceiling)
+
+
+class UracBlueprint(BaseModel):
+    """What the Mastery Engine executes for one micro-lesson"""
+    understand: str
+    retain: str
+    apply: str
+    connect: str
+
 
-User Objective: {user_objective}
+class Lesson(BaseModel):
+    """One micro-lesson of a module plan"""
+    sequence: int
+    topic: str
+    urac_blueprint: UracBlueprint
 
-Current Chapter:
-Chapter: {chapter_num}
-Title: {title}
-Outcome: {outcome}
-Concepts: {json.dumps(concepts, indent=2)}
-Practice: {json.dumps(practice, indent=2)}
-Unlocks: {unlocks}
 
-Acquired Knowledge History:
-{acquired_knowledge_str}
-</user_input>"""
+class ModulePlan(BaseModel):
+    """Structured-output schema Gemini is constrained to when planning a module"""
+    module_id: int
+    module_context_bridge: str
+    lesson_plan: List[Lesson]
+    acquired_competencies: List[str]
+
+
+class LessonOutline(BaseModel):
+    """A micro-lesson without its blueprint, for fan-out outlines"""
+    sequence: int
+    topic: str
+
+
+class ModuleOutline(BaseModel):
+    """Schema for the fan-out outline call"""
+    module_id: int
+    module_context_bridge: str
+    lesson_plan: List[LessonOutline]
+    acquired_competencies: List[str]
+
+
+class ModulePlannerAgent:
+    """
+    Module planner that breaks down high-level modules into atomic micro-lessons.
+    """
+
+    def __init__(self, model_provider: str = "gemini", fanout_lessons: bool = False, cache_dir: str = None):
+        """
+        Initialize the agent with specified model provider.
+
+        Args:
+            model_provider: Either "gemini" or "groq"
+            fanout_lessons: In aplan_module(), generate the outline first and then
+                every lesson's URAC blueprint in parallel instead of one long response
+            cache_dir: Optional directory persisting finished plans across runs
+                (one <hash>.json per plan) behind the in-process cache
+        """
+        self.model_provider = model_provider.lower()
+        self.fanout_lessons = fanout_lessons
+        self.cache_dir = cache_dir
 
         if self.model_provider == "gemini":
-            return self._generate_with_gemini(system_prompt, user_prompt)
+            self.model_name = "gemini-3-flash-preview"
+            self.client = self._setup_gemini()
+        elif self.model_provider == "groq":
+            self.model_name = "openai/gpt-oss-120b"
+            self.client = self._setup_groq()
+            self.async_client = self._setup_async_groq()
         else:
-            return self._generate_with_groq(system_prompt, user_prompt)
+            raise ValueError(f"Unknown model provider: {model_provider}. Use 'gemini' or 'groq'")
 
-    def _generate_with_gemini(self, system_prompt: str, user_prompt: str):
-        """Generate lesson plan using Gemini."""
-        try:
-            contents = [
-                types.Content(
-                    role="user",
-                    parts=[
-                        types.Part.from_text(text=f"{system_prompt}\n\n{user_prompt}"),
-                    ],
+    def _setup_gemini(self):
+        """Setup Google GenAI client."""
+        api_key = os.getenv("GEMINI_API_KEY")
+        if not api_key:
+            raise ValueError("GEMINI_API_KEY not found in .env")
+        # Provider SDKs are imported on first use, so a run only pays for the one it picks
+        from google import genai
+        from google.genai import types
+
+        return genai.Client(
+            api_key=api_key,
+            http_options=types.HttpOptions(
+                client_args={"limits": _http_limits()},
+                # A custom transport keeps client.aio on httpx (and this pool) even
+                # when aiohttp is installed, which would otherwise drop the limits
+                async_client_args={"transport": httpx.AsyncHTTPTransport(limits=_http_limits())},
+                retry_options=types.HttpRetryOptions(
+                    attempts=LLM_MAX_ATTEMPTS,
+                    initial_delay=RETRY_INITIAL_DELAY,
+                    max_delay=RETRY_MAX_DELAY,
+                    exp_base=2,
+                    jitter=1,
+                    http_status_codes=[408, 429, 500, 502, 503, 504],
                 ),
-            ]
+            ),
+        )
+
+    def _setup_groq(self):
+        """Setup Groq client."""
+        api_key = os.getenv("GROQ_API_KEY")
+        if not api_key:
+            raise ValueError("GROQ_API_KEY not found in .env")
+        from groq import Groq
+
+        return Groq(
+            api_key=api_key,
+            http_client=httpx.Client(limits=_http_limits()),
+            max_retries=LLM_MAX_ATTEMPTS - 1,
+        )
+
+    def _setup_async_groq(self):
+        """Setup AsyncGroq client for aplan_module()."""
+        from groq import AsyncGroq
+
+        return AsyncGroq(
+            api_key=os.getenv("GROQ_API_KEY"),
+            http_client=httpx.AsyncClient(limits=_http_limits()),
+            max_retries=LLM_MAX_ATTEMPTS - 1,
+        )
+
+    def plan_module(
+        self,
+        user_baseline: str,
+        user_objective: str,
+        current_module: dict,
+        acquired_knowledge_history: list = None
+    ):
+        """
+        Break down a high-level module into atomic micro-lessons.
+
+        Args:
+            user_baseline: The user's current knowledge and skills
+            user_objective: The specific goal the user wants to achieve
+            current_module: The module to break down (from learning path)
+            acquired_knowledge_history: List of competencies from previous modules
+
+        Returns:
+            Dictionary with lesson plan following URAC framework
+        """
+        system_prompt, user_prompt = self._build_prompts(
+            user_baseline, user_objective, current_module, acquired_knowledge_history
+        )
+
+        cache_key = self._plan_cache_key(system_prompt, user_prompt, fanout=False)
+        cached = self._get_cached_plan(cache_key)
+        if cached is not None:
+            return cached
 
-            generate_content_config = types.GenerateContentConfig(
-                temperature=0.0,
-                top_p=1.0,
-                max_output_tokens=16000,
+        if self.model_provider == "gemini":
+            lesson_plan = self._generate_with_gemini(system_prompt, user_prompt)
+        else:
+            lesson_plan = self._generate_with_groq(system_prompt, user_prompt)
+
+        self._store_plan(cache_key, lesson_plan)
+        return lesson_plan
+
+    async def aplan_module(
+        self,
+        user_baseline: str,
+        user_objective: str,
+        current_module: dict,
+        acquired_knowledge_history: list = None
+    ):
+        """
+        Async variant of plan_module() using client.aio (Gemini) or AsyncGroq.
+
+        Args:
+            user_baseline: The user's current knowledge and skills
+            user_objective: The specific goal the user wants to achieve
+            current_module: The module to break down (from learning path)
+            acquired_knowledge_history: List of competencies from previous modules
+
+        Returns:
+            Dictionary with lesson plan following URAC framework
+        """
+        system_prompt, user_prompt = self._build_prompts(
+            user_baseline, user_objective, current_module, acquired_knowledge_history
+        )
+
+        cache_key = self._plan_cache_key(system_prompt, user_prompt, fanout=self.fanout_lessons)
+        cached = self._get_cached_plan(cache_key)
+        if cached is not None:
+            return cached
+
+        if self.fanout_lessons:
+            lesson_plan = await self._aplan_module_fanout(system_prompt, user_prompt)
+        else:
+            lesson_plan = await self._agenerate(system_prompt, user_prompt)
+
+        self._store_plan(cache_key, lesson_plan)
+        return lesson_plan
+
+    def _plan_cache_key(self, system_prompt: str, user_prompt: str, fanout: bool) -> str:
+        """Hash everything that determines a plan: format version, model, sampling, mode and prompts."""
+        parts = (
+            PLAN_CACHE_VERSION, self.model_name, PLAN_TEMPERATURE, PLAN_TOP_P, PLAN_MAX_OUTPUT_TOKENS,
+            fanout, system_prompt, user_prompt,
+        )
+        return hashlib.blake2b("\x1f".join(str(p) for p in parts).encode()).hexdigest()
+
+    def _get_cached_plan(self, key: str):
+        """Return a copy of a cached plan (token_usage cleared, nothing was spent), or None."""
+        plan = _PLAN_CACHE.get(key)
+        if plan is None and self.cache_dir:
+            path = os.path.join(self.cache_dir, f"{key}.json")
+            if os.path.exists(path):
+                with open(path, "rb") as f:
+                    plan = orjson.loads(f.read())
+                _PLAN_CACHE[key] = plan
+        if plan is None:
+            return None
+        logger.info("Lesson plan served from cache")
+        return {**copy.deepcopy(plan), "token_usage": None}
+
+    def _store_plan(self, key: str, lesson_plan: dict):
+        """Remember a finished plan in-process (evicting the oldest) and on disk if configured."""
+        if len(_PLAN_CACHE) >= PLAN_CACHE_SIZE:
+            _PLAN_CACHE.pop(next(iter(_PLAN_CACHE)))
+        plan = copy.deepcopy(lesson_plan)
+        _PLAN_CACHE[key] = plan
+        if self.cache_dir:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            with open(os.path.join(self.cache_dir, f"{key}.json"), "wb") as f:
+                f.write(orjson.dumps(plan))
+
+    async def _agenerate(self, system_prompt: str, user_prompt: str, response_schema=ModulePlan):
+        """Run one async generation with the configured provider."""
+        if self.model_provider == "gemini":
+            return await self._agenerate_with_gemini(system_prompt, user_prompt, response_schema)
+        else:
+            return await self._agenerate_with_groq(system_prompt, user_prompt)
+
+    async def _aplan_module_fanout(self, system_prompt: str, user_prompt: str):
+        """
+        Plan a module as an outline call followed by parallel per-lesson blueprint calls.
+
+        Output tokens dominate latency, so splitting the blueprints across
+        concurrent requests cuts wall time roughly by the number of lessons.
+        Every call shares the same system prompt and user input prefix.
+
+        Returns:
+            Dictionary in the same format as plan_module()
+        """
+        outline = await self._agenerate(system_prompt, user_prompt + OUTLINE_INSTRUCTIONS, ModuleOutline)
+        lessons = outline.get("lesson_plan", [])
+        outline_str = "\n".join(f"{lesson['sequence']}. {lesson['topic']}" for lesson in lessons)
+
+        blueprints = await asyncio.gather(*[
+            self._agenerate(
+                system_prompt,
+                user_prompt + BLUEPRINT_INSTRUCTIONS.format(
+                    outline=outline_str, sequence=lesson["sequence"], topic=lesson["topic"]
+                ),
+                UracBlueprint,
             )
+            for lesson in lessons
+        ])
+
+        usages = [outline.pop("token_usage", None)]
+        for lesson, blueprint in zip(lessons, blueprints):
+            usages.append(blueprint.pop("token_usage", None))
+            lesson["urac_blueprint"] = {
+                key: blueprint.get(key, "") for key in ("understand", "retain", "apply", "connect")
+            }
+
+        outline["token_usage"] = self._sum_token_usage(usages)
+        return outline
+
+    def _sum_token_usage(self, usages: list):
+        """Combine the token usage of several calls into one record (None if none reported)."""
+        usages = [usage for usage in usages if usage]
+        if not usages:
+            return None
+        return {
+            "prompt_tokens": sum(usage["prompt_tokens"] for usage in usages),
+            "completion_tokens": sum(usage["completion_tokens"] for usage in usages),
+            "total_tokens": sum(usage["total_tokens"] for usage in usages),
+            "model_name": self.model_name
+        }
+
+    def _build_prompts(
+        self,
+        user_baseline: str,
+        user_objective: str,
+        current_module: dict,
+        acquired_knowledge_history: list = None
+    ):
+        """Build the system and user prompts for one module."""
+        if acquired_knowledge_history is None:
+            acquired_knowledge_history = []
+
+        logger.info("Planning module %r with %s (%s)", current_module.get('title', 'N/A'), self.model_name, self.model_provider)
+
+        if acquired_knowledge_history:
+            acquired_knowledge_str = "\n".join(["- " + str(comp) for comp in acquired_knowledge_history])
+        else:
+            acquired_knowledge_str = "None (this is the first module)"
+
+        # Compact dumps: the model reads tokens, not indentation
+        concepts = orjson.dumps(current_module.get('concepts')).decode()
+        practice = orjson.dumps(current_module.get('practice')).decode()
+
+        user_prompt = "".join([
+            "<user_input>\nUser Baseline: ", str(user_baseline),
+            "\n\nUser Objective: ", str(user_objective),
+            "\n\nCurrent Chapter:\nChapter: ", str(current_module.get('chapter')),
+            "\nTitle: ", str(current_module.get('title')),
+            "\nOutcome: ", str(current_module.get('outcome')),
+            "\nConcepts: ", concepts,
+            "\nPractice: ", practice,
+            "\nUnlocks: ", str(current_module.get('unlocks')),
+            "\n\nAcquired Knowledge History:\n", acquired_knowledge_str,
+            "\n</user_input>",
+        ])
+
+        return SYSTEM_PROMPT, user_prompt
+
+    def _gemini_request(self, system_prompt: str, user_prompt: str, response_schema, max_output_tokens: int):
+        """Build the Gemini contents and config for a lesson plan request."""
+        from google.genai import types
+
+        contents = [
+            types.Content(
+                role="user",
+                parts=[
+                    types.Part.from_text(text=user_prompt),
+                ],
+            ),
+        ]
+
+        generate_content_config = types.GenerateContentConfig(
+            system_instruction=system_prompt,
+            temperature=PLAN_TEMPERATURE,
+            top_p=PLAN_TOP_P,
+            max_output_tokens=max_output_tokens,
+            # Constrained decoding: the response is always parseable JSON of this shape
+            response_mime_type="application/json",
+            response_schema=response_schema,
+        )
+
+        return contents, generate_content_config
 
-            print("📝 Generating lesson plan with Gemini...\n")
-            print("─" * 80)
-
-            start_time = time.time()
-            usage_metadata = None
-            finish_reason = None
-
-            full_response = ""
-            for chunk in self.client.models.generate_content_stream(
-                model=self.model_name,
-                contents=contents,
-                config=generate_content_config,
-            ):
-                if chunk.text:
-                    full_response += chunk.text
-                if chunk.usage_metadata:
-                    usage_metadata = chunk.usage_metadata
-                if hasattr(chunk, 'candidates') and chunk.candidates:
-                    if hasattr(chunk.candidates[0], 'finish_reason'):
-                        finish_reason = chunk.candidates[0].finish_reason
-
-            end_time = time.time()
-            duration = end_time - start_time
-
-            print("\n" + "─" * 80 + "\n")
-
-            response_length = len(full_response)
-            print(f"📊 Stats:")
-            print(f"   ⏱️  Time: {duration:.2f}s")
-            if usage_metadata:
-                input_tokens = usage_metadata.prompt_token_count
-                output_tokens = usage_metadata.candidates_token_count
-                total_tokens = usage_metadata.total_token_count
-                print(f"   🔢 Tokens: {total_tokens:,} (In: {input_tokens:,}, Out: {output_tokens:,})")
-            else:
-                print(f"   🔢 Tokens: Unknown")
-            print(f"   📝 Response length: {response_length:,} chars")
-            if finish_reason:
-                print(f"   🏁 Finish reason: {finish_reason}")
-            print()
-
-            lesson_plan = self._extract_json(full_response)
-
-            # Add token usage for logging
-            token_usage = None
-            if usage_metadata:
-                token_usage = {
-                    "prompt_tokens": usage_metadata.prompt_token_count,
-                    "completion_tokens": usage_metadata.candidates_token_count,
-                    "total_tokens": usage_metadata.total_token_count,
-                    "model_name": self.model_name
-                }
-            lesson_plan["token_usage"] = token_usage
-
-            return lesson_plan
+    def _generate_with_gemini(self, system_prompt: str, user_prompt: str, response_schema=ModulePlan):
+        """Generate lesson plan using Gemini."""
+        try:
+            logger.info("Generating lesson plan with Gemini")
+
+            max_tokens = PLAN_MAX_OUTPUT_TOKENS
+            while True:
+                contents, generate_content_config = self._gemini_request(
+                    system_prompt, user_prompt, response_schema, max_tokens
+                )
+                start_time = time.time()
+                # Nothing consumes partial output, so one blocking call beats streaming
+                response = self.client.models.generate_content(
+                    model=self.model_name,
+                    contents=contents,
+                    config=generate_content_config,
+                )
+                max_tokens = _raise_output_cap(_gemini_truncated(response), max_tokens, GEMINI_MAX_OUTPUT_TOKENS)
+                if max_tokens is None:
+                    return self._finalize_gemini(response, time.time() - start_time)
 
         except Exception as e:
-            print(f"\n❌ Error: {e}")
+            logger.error("Lesson plan generation failed: %s", e)
             raise e
 
-    def _generate_with_groq(self, system_prompt: str, user_prompt: str):
-        """Generate lesson plan using Groq."""
+    async def _agenerate_with_gemini(self, system_prompt: str, user_prompt: str, response_schema=ModulePlan):
+        """Async counterpart of _generate_with_gemini()."""
         try:
-            print(f"📝 Generating lesson plan with Groq ({self.model_name})...\n")
+            logger.info("Generating lesson plan with Gemini")
+
+            max_tokens = PLAN_MAX_OUTPUT_TOKENS
+            while True:
+                contents, generate_content_config = self._gemini_request(
+                    system_prompt, user_prompt, response_schema, max_tokens
+                )
+                start_time = time.time()
+                response = await self.client.aio.models.generate_content(
+                    model=self.model_name,
+                    contents=contents,
+                    config=generate_content_config,
+                )
+                max_tokens = _raise_output_cap(_gemini_truncated(response), max_tokens, GEMINI_MAX_OUTPUT_TOKENS)
+                if max_tokens is None:
+                    return self._finalize_gemini(response, time.time() - start_time)
 
-            start_time = time.time()
+        except Exception as e:
+            logger.error("Lesson plan generation failed: %s", e)
+            raise e
 
-            response = self.client.chat.completions.create(
-                model=self.model_name,
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_prompt}
-                ],
-                temperature=0.0,
-                max_tokens=8000,
-                top_p=1,
-                stream=False,
-                reasoning_effort="medium"
+    def _finalize_gemini(self, response, duration: float):
+        """Print stats, parse the Gemini response and attach token usage."""
+        full_response = response.text or ""
+        usage_metadata = response.usage_metadata
+        finish_reason = response.candidates[0].finish_reason if response.candidates else None
+
+        if usage_metadata:
+            logger.info(
+                "Gemini plan: %.2fs, %s tokens (in %s, out %s), %d chars, finish %s",
+                duration, usage_metadata.total_token_count, usage_metadata.prompt_token_count,
+                usage_metadata.candidates_token_count, len(full_response), finish_reason,
             )
+        else:
+            logger.info("Gemini plan: %.2fs, tokens unknown, %d chars, finish %s",
+                        duration, len(full_response), finish_reason)
+
+        lesson_plan = self._extract_json(full_response)
+
+        # Add token usage for logging
+        token_usage = None
+        if usage_metadata:
+            token_usage = {
+                "prompt_tokens": usage_metadata.prompt_token_count,
+                "completion_tokens": usage_metadata.candidates_token_count,
+                "total_tokens": usage_metadata.total_token_count,
+                "model_name": self.model_name
+            }
+        lesson_plan["token_usage"] = token_usage
+
+        return lesson_plan
+
+    def _groq_params(self, system_prompt: str, user_prompt: str, max_tokens: int) -> dict:
+        """Groq chat completion parameters for a lesson plan request."""
+        return {
+            "model": self.model_name,
+            "messages": [
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": user_prompt}
+            ],
+            "temperature": PLAN_TEMPERATURE,
+            "max_tokens": max_tokens,
+            "top_p": PLAN_TOP_P,
+            "stream": False,
+            "reasoning_effort": "medium",
+            # JSON mode: a bare object, no markdown fence to strip
+            "response_format": {"type": "json_object"},
+        }
 
-            end_time = time.time()
-            duration = end_time - start_time
-
-            content = response.choices[0].message.content
+    def _generate_with_groq(self, system_prompt: str, user_prompt: str):
+        """Generate lesson plan using Groq."""
+        try:
+            logger.info("Generating lesson plan with Groq (%s)", self.model_name)
 
-            print("─" * 80 + "\n")
+            max_tokens = PLAN_MAX_OUTPUT_TOKENS
+            while True:
+                start_time = time.time()
+                response = self.client.chat.completions.create(**self._groq_params(system_prompt, user_prompt, max_tokens))
+                truncated = response.choices[0].finish_reason == "length"
+                max_tokens = _raise_output_cap(truncated, max_tokens, GROQ_MAX_OUTPUT_TOKENS)
+                if max_tokens is None:
+                    return self._finalize_groq(response, time.time() - start_time)
 
-            token_usage = None
-            if hasattr(response, 'usage'):
-                usage = response.usage
-                print(f"📊 Stats:")
-                print(f"   ⏱️  Time: {duration:.2f}s")
-                print(f"   🔢 Tokens: {usage.total_tokens:,} (In: {usage.prompt_tokens:,}, Out: {usage.completion_tokens:,})\n")
-                token_usage = {
-                    "prompt_tokens": usage.prompt_tokens,
-                    "completion_tokens": usage.completion_tokens,
-                    "total_tokens": usage.total_tokens,
-                    "model_name": self.model_name
-                }
+        except Exception as e:
+            logger.error("Lesson plan generation failed: %s", e)
+            raise e
 
-            lesson_plan = self._extract_json(content)
-            lesson_plan["token_usage"] = token_usage
-            return lesson_plan
+    async def _agenerate_with_groq(self, system_prompt: str, user_prompt: str):
+        """Async counterpart of _generate_with_groq()."""
+        try:
+            logger.info("Generating lesson plan with Groq (%s)", self.model_name)
+
+            max_tokens = PLAN_MAX_OUTPUT_TOKENS
+            while True:
+                start_time = time.time()
+                response = await self.async_client.chat.completions.create(
+                    **self._groq_params(system_prompt, user_prompt, max_tokens)
+                )
+                truncated = response.choices[0].finish_reason == "length"
+                max_tokens = _raise_output_cap(truncated, max_tokens, GROQ_MAX_OUTPUT_TOKENS)
+                if max_tokens is None:
+                    return self._finalize_groq(response, time.time() - start_time)
 
         except Exception as e:
-            print(f"\n❌ Error: {e}")
+            logger.error("Lesson plan generation failed: %s", e)
             raise e
 
-    def _extract_json(self, text: str):
-        """Extract JSON from LLM response wrapped in markdown."""
+    def _finalize_groq(self, response, duration: float):
+        """Print stats, parse the Groq response and attach token usage."""
+        content = response.choices[0].message.content
+
+        token_usage = None
+        if hasattr(response, 'usage'):
+            usage = response.usage
+            logger.info("Groq plan: %.2fs, %s tokens (in %s, out %s)",
+                        duration, usage.total_tokens, usage.prompt_tokens, usage.completion_tokens)
+            token_usage = {
+                "prompt_tokens": usage.prompt_tokens,
+                "completion_tokens": usage.completion_tokens,
+                "total_tokens": usage.total_tokens,
+                "model_name": self.model_name
+            }
+
+        lesson_plan = self._extract_json(content)
+        lesson_plan["token_usage"] = token_usage
+        return lesson_plan
+
+    def _extract_json(self, text: str) -> dict:
+        """
+        Extract the lesson plan object from an LLM response.
+
+        Raises:
+            ValueError: If no JSON object can be parsed or repaired; json_repair
+                returns "" for garbage and may return a list
+        """
+        result = self._parse_json(text)
+        if not isinstance(result, dict):
+            logger.error("Expected a JSON object, got %s\nResponse (first 800 chars): %s",
+                         type(result).__name__, text[:800])
+            raise ValueError(f"Invalid JSON response: expected an object, got {type(result).__name__}")
+        return result
+
+    def _parse_json(self, text: str):
+        """Parse JSON from an LLM response, stripping a markdown fence and repairing if needed."""
         text = text.strip()
 
-        start_marker = "```json"
-        end_marker = "```"
-
-        start_idx = text.find(start_marker)
-        if start_idx == -1:
-            start_marker = "```"
-            start_idx = text.find(start_marker)
-            if start_idx == -1:
-                try:
-                    return json_repair.loads(text)
-                except Exception as e:
-                    print(f"❌ JSON parsing error: {e}")
-                    print(f"Response (first 800 chars): {text[:800]}")
-                    raise ValueError(f"Invalid JSON response: {str(e)}")
-
-        end_idx = text.find(end_marker, start_idx + len(start_marker))
-
-        if end_idx == -1:
-            print(f"⚠️  No closing '```' found, attempting to extract JSON anyway...")
-            json_str = text[start_idx + len(start_marker):].strip()
-        else:
-            json_str = text[start_idx + len(start_marker):end_idx].strip()
+        # Fast path: well-formed output needs no fence handling or repair
+        try:
+            return orjson.loads(text)
+        except orjson.JSONDecodeError:
+            pass
+
+        # One pass over ```json / ``` fences; an unclosed fence runs to the end
+        match = _FENCE_RE.search(text)
+        if match is None:
+            try:
+                return _repair_loads(text)
+            except Exception as e:
+                logger.error("JSON parsing error: %s\nResponse (first 800 chars): %s", e, text[:800])
+                raise ValueError(f"Invalid JSON response: {str(e)}")
+
+        json_str = match.group(1).strip()
+        closed = bool(match.group(2))
+        if not closed:
+            logger.warning("No closing '```' found, attempting to extract JSON anyway")
 
         try:
-            result = json_repair.loads(json_str)
-            if end_idx == -1:
-                print(f"  ✅ JSON extracted successfully despite missing closing marker")
+            try:
+                return orjson.loads(json_str)
+            except orjson.JSONDecodeError:
+                result = _repair_loads(json_str)
+            if not closed:
+                logger.info("JSON extracted successfully despite missing closing marker")
             return result
         except Exception as e:
-            print(f"❌ JSON parsing error: {e}")
-            print(f"  JSON string (first 800 chars): {json_str[:800]}")
-            print(f"  JSON string (last 200 chars): {json_str[-200:]}")
+            logger.error("JSON parsing error: %s\nJSON string (first 800 chars): %s\nJSON string (last 200 chars): %s",
+                         e, json_str[:800], json_str[-200:])
             raise ValueError(f"Invalid JSON in code block: {str(e)}")
 
 
 def process_learning_path(
     learning_path_file: str,
     model_provider: str = "gemini",
-    output_file: str = "module_plans.json"
+    output_file: str = "module_plans.json",
+    verbose: bool = False
 ):
     """
     Process all modules in a learning path file.
 
+    Runs aprocess_learning_path() on a fresh event loop, so it is for plain
+    synchronous callers such as the CLI; code already inside an event loop
+    must await aprocess_learning_path() instead.
+
     Args:
         learning_path_file: Path to LPgemini.json file
         model_provider: "gemini" or "groq"
         output_file: Where to save the results
+        verbose: Pretty-print every lesson plan as it is produced
+
+    Raises:
+        RuntimeError: If called from a running event loop
+    """
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        pass
+    else:
+        raise RuntimeError(
+            "process_learning_path() cannot run inside an event loop; "
+            "await aprocess_learning_path() instead"
+        )
+    asyncio.run(aprocess_learning_path(learning_path_file, model_provider, output_file, verbose))
+
+
+async def aprocess_learning_path(
+    learning_path_file: str,
+    model_provider: str = "gemini",
+    output_file: str = "module_plans.json",
+    verbose: bool = False
+):
     """
-    with open(learning_path_file, 'r') as f:
-        data = json.load(f)
+    Async variant of process_learning_path().
+
+    Modules within one path stay sequential: each module's prompt depends on
+    the competencies acquired in the ones before it. Every finished module is
+    appended to <output_file>.jsonl as it completes, so an interrupted run
+    with the same baseline, objective and model resumes after the last
+    finished module; the checkpoint is removed once the consolidated
+    output_file is written.
+
+    Args:
+        learning_path_file: Path to LPgemini.json file
+        model_provider: "gemini" or "groq"
+        output_file: Where to save the results
+        verbose: Pretty-print every lesson plan as it is produced
+    """
+    with open(learning_path_file, 'rb') as f:
+        data = orjson.loads(f.read())
 
     user_baseline = data['input']['user_baseline']
     user_objective = data['input']['user_objective']
     curriculum = data['learning_path']['curriculum']
 
-    print(f"\n{'='*80}")
-    print(f"PROCESSING LEARNING PATH")
-    print(f"{'='*80}")
-    print(f"Total modules: {len(curriculum)}")
-    print(f"Model provider: {model_provider}\n")
+    logger.info("Processing learning path %s: %d modules with %s", learning_path_file, len(curriculum), model_provider)
 
     agent = ModulePlannerAgent(model_provider=model_provider)
 
+    checkpoint_file = output_file + ".jsonl"
+    run_key = {
+        "user_baseline": user_baseline,
+        "user_objective": user_objective,
+        "model_provider": model_provider,
+        "model_name": agent.model_name
+    }
+    finished = _load_checkpoint(checkpoint_file, run_key)
+
     acquired_knowledge_history = []
     module_plans = []
 
-    for idx, module in enumerate(curriculum, 1):
-        print(f"\n{'#'*80}")
-        print(f"PROCESSING MODULE {idx}/{len(curriculum)}")
-        print(f"{'#'*80}\n")
-
-        lesson_plan = agent.plan_module(
-            user_baseline=user_baseline,
-            user_objective=user_objective,
-            current_module=module,
-            acquired_knowledge_history=acquired_knowledge_history
-        )
+    # A checkpoint from a different run is started over, keyed by its header line
+    with open(checkpoint_file, 'ab' if finished else 'wb') as checkpoint:
+        if not finished:
+            checkpoint.write(orjson.dumps({"run": run_key}) + b"\n")
+            checkpoint.flush()
+
+        for idx, module in enumerate(curriculum, 1):
+            # Reuse checkpointed modules only while they match this curriculum
+            entry = finished.get(idx)
+            if entry is not None and entry["original_module"] == module and len(module_plans) == idx - 1:
+                logger.info("Module %d/%d restored from %s", idx, len(curriculum), checkpoint_file)
+                acquired_knowledge_history.extend(entry["lesson_plan"].get('acquired_competencies', []))
+                module_plans.append(entry)
+                continue
+
+            logger.info("Processing module %d/%d", idx, len(curriculum))
+
+            lesson_plan = await agent.aplan_module(
+                user_baseline=user_baseline,
+                user_objective=user_objective,
+                current_module=module,
+                acquired_knowledge_history=acquired_knowledge_history
+            )
 
-        print_lesson_plan(lesson_plan, module['title'])
+            if verbose:
+                print_lesson_plan(lesson_plan, module['title'])
 
-        new_competencies = lesson_plan.get('acquired_competencies', [])
-        acquired_knowledge_history.extend(new_competencies)
+            new_competencies = lesson_plan.get('acquired_competencies', [])
+            acquired_knowledge_history.extend(new_competencies)
 
-        module_plans.append({
-            "module_order": idx,
-            "original_module": module,
-            "lesson_plan": lesson_plan,
-            "acquired_knowledge_at_this_point": acquired_knowledge_history.copy()
-        })
+            entry = {
+                "module_order": idx,
+                "original_module": module,
+                "lesson_plan": lesson_plan,
+                # Competencies acquired so far are all_competencies[:competency_slice_end]
+                "competency_slice_end": len(acquired_knowledge_history)
+            }
+            module_plans.append(entry)
+            checkpoint.write(orjson.dumps(entry) + b"\n")
+            checkpoint.flush()
 
     output = {
         "input": {
@@ -404,16 +844,107 @@ def process_learning_path(
             "learning_path_file": learning_path_file,
             "model_provider": model_provider
         },
+        "all_competencies": acquired_knowledge_history,
         "module_plans": module_plans
     }
 
-    with open(output_file, 'w') as f:
-        json.dump(output, f, indent=2)
+    with open(output_file, 'wb') as f:
+        f.write(orjson.dumps(output, option=orjson.OPT_INDENT_2))
+    os.remove(checkpoint_file)
 
-    print(f"\n{'='*80}")
-    print(f"✅ All modules processed!")
-    print(f"✅ Results saved to: {output_file}")
-    print(f"{'='*80}\n")
+    logger.info("All %d modules processed, results saved to %s", len(module_plans), output_file)
+
+
+def _load_checkpoint(checkpoint_file: str, run_key: dict) -> dict:
+    """
+    Read finished module entries from a JSONL checkpoint, keyed by module_order.
+
+    Returns an empty dict when the checkpoint is missing or its header line
+    records a different baseline, objective or model than run_key.
+    """
+    if not os.path.exists(checkpoint_file):
+        return {}
+    finished = {}
+    with open(checkpoint_file, 'rb') as f:
+        try:
+            header = orjson.loads(f.readline())
+        except orjson.JSONDecodeError:
+            return {}
+        if not isinstance(header, dict) or header.get("run") != run_key:
+            logger.info("Ignoring checkpoint %s from a different run", checkpoint_file)
+            return {}
+        for line in f:
+            try:
+                entry = orjson.loads(line)
+            except orjson.JSONDecodeError:
+                # A crash mid-write leaves a partial last line
+                break
+            finished[entry["module_order"]] = entry
+    return finished
+
+
+async def process_many_learning_paths(
+    jobs: list,
+    model_provider: str = "gemini",
+    max_concurrency: int = MAX_CONCURRENT_PATHS
+):
+    """
+    Plan several independent learning paths concurrently.
+
+    Each path is processed sequentially as in aprocess_learning_path(); the
+    paths themselves run side by side, capped by a semaphore to stay inside
+    provider rate limits.
+
+    Args:
+        jobs: List of (learning_path_file, output_file) tuples
+        model_provider: "gemini" or "groq"
+        max_concurrency: Maximum number of paths planned at once
+
+    Returns:
+        List with None for each path that succeeded or its exception if it failed
+    """
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def _one(job):
+        learning_path_file, output_file = job
+        async with semaphore:
+            await aprocess_learning_path(learning_path_file, model_provider, output_file)
+
+    return await asyncio.gather(*[_one(job) for job in jobs], return_exceptions=True)
+
+
+async def acompare_providers(
+    learning_path_file: str,
+    providers: list = ("gemini", "groq"),
+    output_file: str = "module_plans.json"
+):
+    """
+    Plan the same learning path with several providers at once, for A/B comparison.
+
+    Each provider builds its own acquired-knowledge history, so providers run
+    as independent curricula side by side rather than in lockstep per module.
+    Results go to one file per provider, e.g. module_plans.groq.json.
+
+    Args:
+        learning_path_file: Path to LPgemini.json file
+        providers: Provider names ("gemini", "groq")
+        output_file: Base output path; the provider name is inserted before the extension
+
+    Returns:
+        Dict mapping provider to its output file, or to its exception if it failed
+    """
+    root, ext = os.path.splitext(output_file)
+    output_files = {provider: f"{root}.{provider}{ext}" for provider in providers}
+
+    results = await asyncio.gather(*[
+        aprocess_learning_path(learning_path_file, provider, output_files[provider])
+        for provider in providers
+    ], return_exceptions=True)
+
+    return {
+        provider: result if isinstance(result, BaseException) else output_files[provider]
+        for provider, result in zip(providers, results)
+    }
 
 
 def print_lesson_plan(lesson_plan: dict, module_title: str):
@@ -448,6 +979,14 @@ def print_lesson_plan(lesson_plan: dict, module_title: str):
 
 def main():
     """Main function for testing."""
+    verbose = "--verbose" in sys.argv[1:]
+    # One stdout handler; NEB_LOG=INFO shows per-module progress and stats
+    logging.basicConfig(
+        level=os.getenv("NEB_LOG", "INFO" if verbose else "WARNING").upper(),
+        format="%(message)s",
+        stream=sys.stdout,
+    )
+
     print("\n" + "="*80)
     print("MODULE PLANNER AGENT")
     print("="*80)
@@ -466,7 +1005,8 @@ def main():
         process_learning_path(
             learning_path_file=learning_path_file,
             model_provider=model_provider,
-            output_file="module_plans.json"
+            output_file="module_plans.json",
+            verbose=verbose
         )
     except Exception as e:
         print(f"\n❌ Error: {e}")
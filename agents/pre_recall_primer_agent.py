@@ -10,72 +10,33 @@ Generates a brief, engaging primer before each lesson to:
 Uses llama-3.3-70b-versatile for pedagogically sound activation prompts.
 """
 
+import asyncio
+import functools
+import hashlib
+import importlib.util
 import os
-import json
+import sys
+import threading
+import time
+from types import SimpleNamespace
+import httpx
+import orjson
 from dotenv import load_dotenv
-from groq import Groq
-
-load_dotenv()
+from groq import AsyncGroq, Groq
+from typing import List
+from pydantic import BaseModel
 
 # LLM Configuration
 PRE_RECALL_LLM_CONFIG = ("groq", "meta-llama/llama-4-maverick-17b-128e-instruct")
 
+# Three MCQs, a confidence prompt and a hook fit well under this; a tight
+# cap bounds billed output if the model rambles
+PRIMER_MAX_TOKENS = 700
 
-class PreRecallPrimerAgent:
-    """Generates cognitive activation primers before lessons."""
-
-    def __init__(self):
-        """Initialize the agent with configured Groq client."""
-        self.provider = PRE_RECALL_LLM_CONFIG[0]
-        self.model_name = PRE_RECALL_LLM_CONFIG[1]
-        self.client = self._setup_llm()
-        self.total_tokens = 0
-
-    def _setup_llm(self):
-        """Setup Groq client."""
-        api_key = os.getenv("GROQ_API_KEY")
-        if not api_key:
-            raise ValueError("GROQ_API_KEY not found in .env")
-        return Groq(api_key=api_key)
-
-    def _log_token_usage(self, response, call_type: str):
-        """Log token usage from Groq response and accumulate total."""
-        try:
-            if hasattr(response, 'usage'):
-                usage = response.usage
-                input_tokens = usage.prompt_tokens
-                output_tokens = usage.completion_tokens
-                total_tokens = usage.total_tokens
+# Primers per request in run_batch(); quality drops quickly beyond small batches
+PRIMER_BATCH_SIZE = 4
 
-                if total_tokens > 0:
-                    print(f"  📊 [{call_type}] {self.model_name}: {total_tokens:,} tokens (in: {input_tokens:,}, out: {output_tokens:,})")
-                    self.total_tokens += total_tokens
-        except Exception:
-            pass
-
-    def run(self, lesson_title: str, topics_covered: list, experience_level: str, learning_objectives: list) -> dict:
-        """
-        Generate a pre-recall primer for a lesson.
-        
-        Args:
-            lesson_title: Title of the upcoming lesson
-            topics_covered: List of topics that will be covered
-            experience_level: User's experience level (Beginner/Intermediate/Advanced)
-            learning_objectives: Specific learning objectives for the lesson
-            
-        Returns:
-            Dictionary with primer text and metadata
-            Note: User's ANSWERS to the primer questions should be captured and passed to Tutor Agent
-        """
-        print(f"\n{'='*80}")
-        print(f"PRE-RECALL PRIMER AGENT - {self.provider.upper()}")
-        print(f"{'='*80}")
-        print(f"Lesson: {lesson_title}")
-        print(f"Level: {experience_level}\n")
-
-        print(f"  🧠 Generating cognitive activation primer...\n")
-
-        system_prompt = """You are the Pre-Recall Primer Agent, a learning science expert specializing in cognitive activation and diagnostic assessment.
+SYSTEM_PROMPT = """You are the Pre-Recall Primer Agent, a learning science expert specializing in cognitive activation and diagnostic assessment.
 
 Your purpose:
 Generate a short, engaging diagnostic assessment that activates prior knowledge, triggers thinking, and reveals the learner's actual level.
@@ -151,102 +112,628 @@ OUTPUT FORMAT (STRICT JSON)
   "curiosity_hook": "1 sentence hook"
 }
 
-Output ONLY valid JSON. No prose before or after."""
+Return a JSON object. Output ONLY valid JSON. No prose before or after."""
+
+# One lesson's fields, shared by the single and batched user prompts
+LESSON_SPEC_TEMPLATE = """Lesson Title: {title}
+Topics Covered: {topics}
+Experience Level: {level}
+Learning Objectives: {objectives}"""
 
-        user_prompt = f"""Create a Pre-Recall Primer for this lesson:
+USER_PROMPT_TEMPLATE = """Create a Pre-Recall Primer for this lesson:
 
-Lesson Title: {lesson_title}
-Topics Covered: {json.dumps(topics_covered)}
-Experience Level: {experience_level}
-Learning Objectives: {json.dumps(learning_objectives)}
+{lesson_spec}
 
 Generate the engaging diagnostic primer now."""
 
+# Follow-up sent once when a primer fails to parse or validate
+JSON_REMINDER = "Return valid JSON only: a single object matching the primer format exactly."
+
+# Appended to SYSTEM_PROMPT when several lessons share one request
+BATCH_INSTRUCTIONS = """
+
+=====================================================
+BATCH MODE
+=====================================================
+You will receive {count} lesson specs, each prefixed with its index in brackets, e.g. [0].
+Return a JSON object of the form {{"primers": [...]}} whose array holds {count} primer
+objects in the same order. Each object matches the primer format above plus an "index"
+field holding the lesson's index."""
+
+# Transient failures (429/5xx, dropped connections) are retried by the Groq
+# SDK with exponential backoff before surfacing as errors
+LLM_MAX_ATTEMPTS = 4
+
+# Maximum primers generated at once by generate_primers(), to stay inside Groq rate limits
+MAX_CONCURRENT_PRIMERS = 8
+
+# Groq Batch API: half-price, results within the completion window. Polling
+# backs off from BATCH_POLL_INITIAL up to BATCH_POLL_MAX seconds.
+BATCH_COMPLETION_WINDOW = "24h"
+BATCH_POLL_INITIAL = 5.0
+BATCH_POLL_MAX = 300.0
+_BATCH_DONE_STATES = {"completed", "failed", "expired", "cancelled"}
+
+# Development reruns can reuse earlier primers from disk; PRIMER_CACHE=1 (in the
+# environment or .env) turns it on
+PRIMER_CACHE_DIR = ".primer_cache"
+
+
+class MCQ(BaseModel):
+    """One diagnostic multiple-choice question"""
+    question: str
+    options: List[str]
+    correct_answer_index: int
+
+
+class Primer(BaseModel):
+    """Shape every primer is validated against before it leaves the agent"""
+    mcq_questions: List[MCQ]
+    confidence_prompt: str
+    curiosity_hook: str
+
+
+def _validate_primer(data) -> dict:
+    """Check LLM output against the Primer schema; pydantic's ValidationError is a ValueError."""
+    return Primer.model_validate(data).model_dump()
+
+
+# HTTP/2 needs the optional h2 package; without it the shared pool uses HTTP/1.1 keep-alive
+_HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+HTTP_MAX_CONNECTIONS = 32
+HTTP_TIMEOUT = 60.0
+
+
+@functools.cache
+def _load_env():
+    """Load .env once per process."""
+    load_dotenv()
+
+
+def _http_client_args() -> dict:
+    """httpx client arguments shared by the sync and async pools."""
+    return {
+        "http2": _HTTP2_AVAILABLE,
+        "limits": httpx.Limits(
+            max_connections=HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=HTTP_MAX_CONNECTIONS,
+        ),
+        "timeout": HTTP_TIMEOUT,
+    }
+
+
+@functools.lru_cache(maxsize=None)
+def _shared_http_client() -> httpx.Client:
+    """Process-wide httpx client, so every agent instance reuses the same connections."""
+    return httpx.Client(**_http_client_args())
+
+
+@functools.lru_cache(maxsize=None)
+def _shared_async_http_client() -> httpx.AsyncClient:
+    """
+    Process-wide httpx.AsyncClient for run_async().
+
+    Its connections belong to the event loop that first uses it, so it suits
+    one long-running loop rather than repeated asyncio.run() calls.
+    """
+    return httpx.AsyncClient(**_http_client_args())
+
+
+class PreRecallPrimerAgent:
+    """Generates cognitive activation primers before lessons."""
+
+    # Fixed attribute set: no per-instance __dict__
+    __slots__ = ("provider", "model_name", "client", "aclient", "total_tokens", "_token_lock")
+
+    def __init__(self):
+        """Initialize the agent with configured Groq client."""
+        self.provider = PRE_RECALL_LLM_CONFIG[0]
+        self.model_name = PRE_RECALL_LLM_CONFIG[1]
+        self.client = self._setup_llm()
+        self.aclient = self._setup_async_llm()
+        self.total_tokens = 0
+        # Guards total_tokens when one agent serves concurrent run() calls
+        self._token_lock = threading.Lock()
+
+    def _setup_llm(self):
+        """Setup Groq client."""
+        return Groq(api_key=self._api_key(), http_client=_shared_http_client(), max_retries=LLM_MAX_ATTEMPTS - 1)
+
+    def _setup_async_llm(self):
+        """Setup AsyncGroq client for run_async()."""
+        return AsyncGroq(api_key=self._api_key(), http_client=_shared_async_http_client(), max_retries=LLM_MAX_ATTEMPTS - 1)
+
+    def _api_key(self) -> str:
+        """Read GROQ_API_KEY at construction time, loading .env on first use."""
+        _load_env()
+        api_key = os.getenv("GROQ_API_KEY")
+        if not api_key:
+            raise ValueError("GROQ_API_KEY not found in .env")
+        return api_key
+
+    def _log_token_usage(self, usage, call_type: str):
+        """Log token usage from a Groq usage object and accumulate total."""
         try:
-            response = self.client.chat.completions.create(
-                model=self.model_name,
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_prompt}
-                ],
-                temperature=0.4,  # Slightly higher for more engaging questions
-                max_completion_tokens=2000,
-                top_p=1,
-                stream=False,
-                stop=None
-            )
+            if usage is not None:
+                input_tokens = usage.prompt_tokens
+                output_tokens = usage.completion_tokens
+                total_tokens = usage.total_tokens
 
-            content = response.choices[0].message.content
-            self._log_token_usage(response, "Pre-Recall Primer Generation")
+                if total_tokens > 0:
+                    print(f"  📊 [{call_type}] {self.model_name}: {total_tokens:,} tokens (in: {input_tokens:,}, out: {output_tokens:,})")
+                    with self._token_lock:
+                        self.total_tokens += total_tokens
+        except AttributeError:
+            # Response without the expected usage fields; nothing to count
+            pass
 
-            primer_data = self._extract_json(content)
+    def run(self, lesson_title: str, topics_covered: list, experience_level: str, learning_objectives: list) -> dict:
+        """
+        Generate a pre-recall primer for a lesson.
+        
+        Args:
+            lesson_title: Title of the upcoming lesson
+            topics_covered: List of topics that will be covered
+            experience_level: User's experience level (Beginner/Intermediate/Advanced)
+            learning_objectives: Specific learning objectives for the lesson
+            
+        Returns:
+            Dictionary with primer text and metadata
+            Note: User's ANSWERS to the primer questions should be captured and passed to Tutor Agent
+        """
+        try:
+            self._print_banner(lesson_title, experience_level)
+            params = self._request_params(lesson_title, topics_covered, experience_level, learning_objectives)
+            cache_path = self._cache_path(params)
+            cached = self._load_cached(cache_path)
+            if cached is not None:
+                return cached
+
+            try:
+                primer_data = self._request_primer(params)
+            except ValueError as e:
+                # Malformed or off-schema output: one more try with a reminder
+                print(f"  ⚠️  Invalid primer ({e}), retrying once")
+                primer_data = self._request_primer(self._with_json_reminder(params))
+            self._store_cached(cache_path, primer_data)
+            return primer_data
+
+        except Exception as e:
+            print(f"\n❌ Error: {e}")
+            raise e
+
+    async def run_async(self, lesson_title: str, topics_covered: list, experience_level: str, learning_objectives: list) -> dict:
+        """
+        Async variant of run() using AsyncGroq, so several primers can be generated concurrently.
 
+        Args:
+            lesson_title: Title of the upcoming lesson
+            topics_covered: List of topics that will be covered
+            experience_level: User's experience level (Beginner/Intermediate/Advanced)
+            learning_objectives: Specific learning objectives for the lesson
+
+        Returns:
+            Dictionary with primer text and metadata
+        """
+        try:
+            self._print_banner(lesson_title, experience_level)
+            params = self._request_params(lesson_title, topics_covered, experience_level, learning_objectives)
+            cache_path = self._cache_path(params)
+            cached = self._load_cached(cache_path)
+            if cached is not None:
+                return cached
+
+            try:
+                primer_data = await self._arequest_primer(params)
+            except ValueError as e:
+                # Malformed or off-schema output: one more try with a reminder
+                print(f"  ⚠️  Invalid primer ({e}), retrying once")
+                primer_data = await self._arequest_primer(self._with_json_reminder(params))
+            self._store_cached(cache_path, primer_data)
             return primer_data
 
         except Exception as e:
             print(f"\n❌ Error: {e}")
             raise e
 
-    def _extract_json(self, text: str):
-        """Extract JSON from LLM response wrapped in markdown."""
-        text = text.strip()
+    def run_batch(self, lessons: list, experience_level: str) -> list:
+        """
+        Generate primers for several lessons, packing up to PRIMER_BATCH_SIZE into each request.
 
-        start_marker = "```json"
-        end_marker = "```"
+        The system prompt is sent once per batch instead of once per lesson.
+        A batch whose response can't be matched back to its lessons falls
+        back to one run() call per lesson.
 
-        start_idx = text.find(start_marker)
-        if start_idx == -1:
-            start_marker = "```"
-            start_idx = text.find(start_marker)
-            if start_idx == -1:
-                try:
-                    return json.loads(text)
-                except json.JSONDecodeError as e:
-                    print(f"❌ JSON parsing error: {e}")
-                    print(f"Response (first 500 chars): {text[:500]}")
-                    raise ValueError(f"Invalid JSON response: {str(e)}")
+        Args:
+            lessons: Lesson dicts with title, topics_covered and learning_objectives
+            experience_level: User's experience level (Beginner/Intermediate/Advanced)
 
-        end_idx = text.find(end_marker, start_idx + len(start_marker))
+        Returns:
+            List of primer dicts in the same order as lessons
+        """
+        primers = []
+        for start in range(0, len(lessons), PRIMER_BATCH_SIZE):
+            batch = lessons[start:start + PRIMER_BATCH_SIZE]
+            try:
+                primers.extend(self._run_one_batch(batch, experience_level))
+            except ValueError as e:
+                print(f"  ⚠️  Batched primer request failed ({e}), generating one by one")
+                primers.extend(
+                    self.run(
+                        lesson_title=lesson.get('title', 'Unknown Challenge'),
+                        topics_covered=lesson.get('topics_covered', []),
+                        experience_level=experience_level,
+                        learning_objectives=lesson.get('learning_objectives', [])
+                    )
+                    for lesson in batch
+                )
+        return primers
+
+    def _run_one_batch(self, batch: list, experience_level: str) -> list:
+        """Generate primers for one batch of lessons in a single request."""
+        print(f"\n  🧠 Generating {len(batch)} cognitive activation primers in one request...\n")
+
+        user_prompt = "\n\n".join(
+            f"[{i}] " + LESSON_SPEC_TEMPLATE.format(
+                title=lesson.get('title', 'Unknown Challenge'),
+                topics=orjson.dumps(lesson.get('topics_covered', [])).decode(),
+                level=experience_level,
+                objectives=orjson.dumps(lesson.get('learning_objectives', [])).decode()
+            )
+            for i, lesson in enumerate(batch)
+        )
 
-        if end_idx == -1:
-            raise ValueError(f"No closing '```' found for JSON block: {text[:200]}...")
+        response = self.client.chat.completions.create(
+            model=self.model_name,
+            messages=[
+                {"role": "system", "content": SYSTEM_PROMPT + BATCH_INSTRUCTIONS.format(count=len(batch))},
+                {"role": "user", "content": user_prompt}
+            ],
+            temperature=0.4,
+            max_completion_tokens=PRIMER_MAX_TOKENS * len(batch),
+            top_p=1,
+            stream=False,
+            stop=None,
+            # JSON mode only emits objects, hence the {"primers": [...]} wrapper
+            response_format={"type": "json_object"}
+        )
 
-        json_str = text[start_idx + len(start_marker) : end_idx].strip()
+        content = response.choices[0].message.content
+        self._log_token_usage(getattr(response, 'usage', None), f"Pre-Recall Primer Batch x{len(batch)}")
+
+        result = self._extract_json(content)
+        if isinstance(result, dict):
+            result = result.get("primers")
+        if not isinstance(result, list) or len(result) != len(batch) or not all(isinstance(p, dict) for p in result):
+            raise ValueError(f"expected a JSON array of {len(batch)} primers")
+
+        by_index = {primer.pop("index", i): primer for i, primer in enumerate(result)}
+        if sorted(by_index) != list(range(len(batch))):
+            raise ValueError("primer indices do not match the lessons")
+        return [_validate_primer(by_index[i]) for i in range(len(batch))]
+
+    def _request_params(self, lesson_title: str, topics_covered: list, experience_level: str, learning_objectives: list) -> dict:
+        """Build the Groq chat completion parameters for one primer."""
+        user_prompt = USER_PROMPT_TEMPLATE.format(
+            lesson_spec=LESSON_SPEC_TEMPLATE.format(
+                title=lesson_title,
+                topics=orjson.dumps(topics_covered).decode(),
+                level=experience_level,
+                objectives=orjson.dumps(learning_objectives).decode()
+            )
+        )
 
+        return {
+            "model": self.model_name,
+            "messages": [
+                {"role": "system", "content": SYSTEM_PROMPT},
+                {"role": "user", "content": user_prompt}
+            ],
+            "temperature": 0.4,  # Slightly higher for more engaging questions
+            "max_completion_tokens": PRIMER_MAX_TOKENS,
+            "top_p": 1,
+            # JSON mode doesn't support streaming on Groq, so the primer comes back whole
+            "stream": False,
+            "stop": None,
+            # JSON mode: the response is a bare JSON object, no markdown fence
+            "response_format": {"type": "json_object"}
+        }
+
+    def _print_banner(self, lesson_title: str, experience_level: str):
+        """Announce the primer about to be generated."""
+        print(f"\n{'='*80}")
+        print(f"PRE-RECALL PRIMER AGENT - {self.provider.upper()}")
+        print(f"{'='*80}")
+        print(f"Lesson: {lesson_title}")
+        print(f"Level: {experience_level}\n")
+
+        print(f"  🧠 Generating cognitive activation primer...\n")
+
+    def submit_batch(self, lessons: list, experience_level: str) -> str:
+        """
+        Submit primer requests for several lessons as one Groq Batch API job.
+
+        For non-interactive bulk runs: batch jobs cost half as much as
+        real-time requests but finish anywhere within the completion window.
+
+        Args:
+            lessons: Lesson dicts with title, topics_covered and learning_objectives
+            experience_level: User's experience level (Beginner/Intermediate/Advanced)
+
+        Returns:
+            Batch job ID to pass to collect_batch()
+        """
+        lines = []
+        for i, lesson in enumerate(lessons):
+            params = self._request_params(
+                lesson.get('title', 'Unknown Challenge'),
+                lesson.get('topics_covered', []),
+                experience_level,
+                lesson.get('learning_objectives', [])
+            )
+            lines.append(orjson.dumps({
+                "custom_id": f"C{i}",
+                "method": "POST",
+                "url": "/v1/chat/completions",
+                "body": params,
+            }))
+
+        batch_file = self.client.files.create(file=("primers.jsonl", b"\n".join(lines)), purpose="batch")
+        batch = self.client.batches.create(
+            input_file_id=batch_file.id,
+            endpoint="/v1/chat/completions",
+            completion_window=BATCH_COMPLETION_WINDOW,
+        )
+        print(f"  📦 Submitted batch {batch.id} with {len(lessons)} primer requests")
+        return batch.id
+
+    def collect_batch(self, batch_id: str, count: int) -> list:
+        """
+        Wait for a batch job from submit_batch() and parse its primers.
+
+        Args:
+            batch_id: ID returned by submit_batch()
+            count: Number of lessons submitted
+
+        Returns:
+            List of primer dicts in submission order, with None for any request that failed
+        """
+        delay = BATCH_POLL_INITIAL
+        while True:
+            batch = self.client.batches.retrieve(batch_id)
+            if batch.status in _BATCH_DONE_STATES:
+                break
+            time.sleep(delay)
+            delay = min(delay * 2, BATCH_POLL_MAX)
+
+        if not batch.output_file_id:
+            raise RuntimeError(f"Primer batch {batch_id} ended with status {batch.status}")
+
+        primers = [None] * count
+        output = self.client.files.content(batch.output_file_id).read()
+        for line in output.splitlines():
+            if not line.strip():
+                continue
+            result = orjson.loads(line)
+            index = int(result["custom_id"][1:])
+            response = result.get("response") or {}
+            if result.get("error") or response.get("status_code") != 200:
+                print(f"  ❌ Primer request {result['custom_id']} failed: {result.get('error') or response.get('status_code')}")
+                continue
+            body = response["body"]
+            self._log_token_usage(SimpleNamespace(**body["usage"]) if body.get("usage") else None,
+                                  "Pre-Recall Primer Batch API")
+            try:
+                primers[index] = _validate_primer(self._extract_json(body["choices"][0]["message"]["content"]))
+            except ValueError as e:
+                print(f"  ❌ Primer request {result['custom_id']} returned invalid JSON: {e}")
+        return primers
+
+    def _cache_path(self, params: dict):
+        """On-disk cache file for a request, or None when the cache is disabled."""
+        # Read per request: .env is only loaded once an agent is constructed
+        if os.getenv("PRIMER_CACHE") != "1":
+            return None
+        system_prompt, user_prompt = (message["content"] for message in params["messages"])
+        key = hashlib.blake2b(
+            f"{self.model_name}|{system_prompt}|{user_prompt}".encode(), digest_size=16
+        ).hexdigest()
+        return os.path.join(PRIMER_CACHE_DIR, f"{key}.json")
+
+    def _load_cached(self, cache_path):
+        """Return a cached primer for this request, if one was stored."""
+        if cache_path is None or not os.path.exists(cache_path):
+            return None
+        with open(cache_path, 'rb') as f:
+            primer_data = orjson.loads(f.read())
+        print(f"  ♻️  Primer served from cache")
+        return primer_data
+
+    def _store_cached(self, cache_path, primer_data: dict):
+        """Persist a freshly generated primer when the cache is enabled."""
+        if cache_path is None:
+            return
+        os.makedirs(PRIMER_CACHE_DIR, exist_ok=True)
+        with open(cache_path, 'wb') as f:
+            f.write(orjson.dumps(primer_data))
+
+    def _request_primer(self, params: dict) -> dict:
+        """Request one primer completion and parse it."""
+        response = self.client.chat.completions.create(**params)
+        return self._finish_primer(response)
+
+    async def _arequest_primer(self, params: dict) -> dict:
+        """Async counterpart of _request_primer()."""
+        response = await self.aclient.chat.completions.create(**params)
+        return self._finish_primer(response)
+
+    def _with_json_reminder(self, params: dict) -> dict:
+        """Copy of params with a follow-up asking for valid JSON only."""
+        return {
+            **params,
+            "messages": params["messages"] + [{"role": "user", "content": JSON_REMINDER}],
+        }
+
+    def _finish_primer(self, response) -> dict:
+        """Log token usage and parse the primer out of a Groq response."""
+        self._log_token_usage(getattr(response, 'usage', None), "Pre-Recall Primer Generation")
+        return _validate_primer(self._extract_json(response.choices[0].message.content))
+
+    def _extract_json(self, text: str):
+        """Extract JSON from LLM response wrapped in markdown."""
+        text = text.strip()
+
+        # JSON-mode responses are raw JSON; fence handling is only a fallback
+        try:
+            return orjson.loads(text)
+        except orjson.JSONDecodeError as e:
+            _, fence, rest = text.partition("```")
+            if not fence:
+                print(f"❌ JSON parsing error: {e}")
+                print(f"Response (first 500 chars): {text[:500]}")
+                raise ValueError(f"Invalid JSON response: {str(e)}")
+
+        # Drop an optional language tag after the opening fence
+        if rest.startswith("json"):
+            rest = rest[4:]
+        json_str, closed, _ = rest.partition("```")
+        if not closed:
+            raise ValueError(f"No closing '```' found for JSON block: {text[:200]}...")
+
+        json_str = json_str.strip()
         try:
-            return json.loads(json_str)
-        except json.JSONDecodeError as e:
+            return orjson.loads(json_str)
+        except orjson.JSONDecodeError as e:
             print(f"❌ JSON parsing error: {e}")
             print(f"Response around error: {json_str[max(0, e.pos-100):min(len(json_str), e.pos+100)]}")
             raise ValueError(f"Invalid JSON in code block: {str(e)}")
 
 
+# Option labels for print_primer; questions normally have four options
+_OPTION_LETTERS = tuple(chr(65 + i) for i in range(8))
+
+
 def print_primer(primer_data: dict, challenge_title: str):
     """Pretty-print primer data to terminal."""
-    print(f"\n{'='*80}")
-    print(f"PRIMER FOR: {challenge_title}")
-    print(f"{'='*80}\n")
-    print("❓ MCQ Questions:")
+    # Assembled first and written once rather than one print per line
+    lines = [
+        f"\n{'='*80}",
+        f"PRIMER FOR: {challenge_title}",
+        f"{'='*80}\n",
+        "❓ MCQ Questions:",
+    ]
     for i, mcq in enumerate(primer_data['mcq_questions'], 1):
-        print(f"\n  {i}. {mcq['question']}")
+        lines.append(f"\n  {i}. {mcq['question']}")
+        correct = mcq['correct_answer_index']
         for j, opt in enumerate(mcq['options']):
-            marker = "✓" if j == mcq.get('correct_answer_index', -1) else " "
-            print(f"     {chr(65+j)}. {opt} {'[CORRECT]' if marker == '✓' else ''}")
-    print(f"\n🎚️  Confidence: {primer_data['confidence_prompt']}")
-    print(f"\n✨ Hook: {primer_data['curiosity_hook']}")
+            letter = _OPTION_LETTERS[j] if j < len(_OPTION_LETTERS) else chr(65 + j)
+            lines.append(f"     {letter}. {opt} {'[CORRECT]' if j == correct else ''}")
+    lines += [
+        f"\n🎚️  Confidence: {primer_data['confidence_prompt']}",
+        f"\n✨ Hook: {primer_data['curiosity_hook']}",
+    ]
+    sys.stdout.write("\n".join(lines) + "\n")
+
+
+async def generate_primers(agent: PreRecallPrimerAgent, lessons: list, experience_level: str,
+                           max_concurrency: int = MAX_CONCURRENT_PRIMERS, on_primer=None) -> list:
+    """
+    Generate primers for several lessons concurrently.
+
+    Each primer is independent, so the Groq calls overlap instead of running
+    back to back; a semaphore caps how many are in flight.
+
+    Args:
+        agent: Agent whose async client makes the calls
+        lessons: Lesson dicts with title, topics_covered and learning_objectives
+        experience_level: User's experience level
+        max_concurrency: Maximum number of requests in flight
+        on_primer: Optional callback(index, primer) called as soon as each primer is ready
+
+    Returns:
+        List of primer dicts in the same order as lessons
+    """
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def _one(index, lesson):
+        async with semaphore:
+            primer = await agent.run_async(
+                lesson_title=lesson.get('title', 'Unknown Challenge'),
+                topics_covered=lesson.get('topics_covered', []),
+                experience_level=experience_level,
+                learning_objectives=lesson.get('learning_objectives', [])
+            )
+        if on_primer:
+            on_primer(index, primer)
+        return primer
+
+    return await asyncio.gather(*[_one(i, lesson) for i, lesson in enumerate(lessons)])
+
+
+@functools.cache
+def load_lesson_plan(path: str) -> dict:
+    """
+    Parse a lesson plan file once per process.
+
+    The returned dict is shared between callers; treat it as read-only.
+    """
+    with open(path, 'rb') as f:
+        return orjson.loads(f.read())
+
+
+def _primer_entry(idx: int, lesson: dict, primer: dict) -> dict:
+    """Saved record for one challenge's primer."""
+    return {
+        'challenge_number': lesson.get('lesson_number', idx + 1),
+        'challenge_title': lesson.get('title', 'Unknown Challenge'),
+        'topics_covered': lesson.get('topics_covered', []),
+        'learning_objectives': lesson.get('learning_objectives', []),
+        'primer': primer
+    }
+
+
+def _write_json(path: str, data):
+    """Write data as JSON; compact unless DEBUG=1, since indentation only helps human readers."""
+    option = orjson.OPT_INDENT_2 if os.getenv("DEBUG") == "1" else None
+    with open(path, 'wb') as f:
+        f.write(orjson.dumps(data, option=option))
+
+
+async def _generate_all_primers(agent: PreRecallPrimerAgent, challenges: list, experience_level: str,
+                                lesson_file: str, module_number) -> list:
+    """
+    Generate primers for every challenge, showing and saving each as it arrives.
+
+    Each primer's own file is written from a worker thread while the other
+    requests are still in flight; the writes are awaited before returning.
+    """
+    write_tasks = []
+
+    def _on_primer(i, primer):
+        idx, lesson = challenges[i]
+        print_primer(primer, lesson.get('title', 'Unknown Challenge'))
+        entry = _primer_entry(idx, lesson, primer)
+        path = lesson_file.replace('LessonPlan', f"Primer_M{module_number}_C{entry['challenge_number']}")
+        write_tasks.append(asyncio.create_task(asyncio.to_thread(_write_json, path, entry)))
+
+    primers = await generate_primers(
+        agent, [lesson for _, lesson in challenges], experience_level, on_primer=_on_primer
+    )
+    await asyncio.gather(*write_tasks)
+    return primers
 
 
 def get_available_lesson_plans():
     """Find all lesson plan files in current directory."""
-    import glob
-    files = glob.glob("LessonPlan_M*.json")
-    return sorted(files)
+    with os.scandir('.') as entries:
+        return sorted(
+            entry.name for entry in entries
+            if entry.name.startswith("LessonPlan_M") and entry.name.endswith(".json") and entry.is_file()
+        )
 
 
 def main():
     """Test the Pre-Recall Primer Agent using outputs from module_planner_agent.py."""
-    import glob
-    
     print("\n" + "="*80)
     print("PRE-RECALL PRIMER AGENT - LOCAL TEST")
     print("="*80)
@@ -283,8 +770,7 @@ def main():
     
     # Load the selected lesson plan
     try:
-        with open(lesson_file, 'r') as f:
-            data = json.load(f)
+        data = load_lesson_plan(lesson_file)
     except Exception as e:
         print(f"❌ Error loading {lesson_file}: {e}")
         return
@@ -329,37 +815,51 @@ def main():
     
     agent = PreRecallPrimerAgent()
     all_primers = []
-    
+
+    # --batch: submit all challenges to the Batch API and wait (non-interactive precompute)
+    if challenge_choice == 'A' and "--batch" in sys.argv[1:]:
+        selected = [lesson for _, lesson in challenges_to_process]
+        batch_id = agent.submit_batch(selected, experience_level)
+        primers = agent.collect_batch(batch_id, len(selected))
+        failed = [i for i, primer in enumerate(primers) if primer is None]
+        if failed:
+            print(f"❌ {len(failed)} primer(s) failed in batch {batch_id}; rerun without --batch to retry")
+            return
+        for (_, lesson), primer in zip(challenges_to_process, primers):
+            print_primer(primer, lesson.get('title', 'Unknown Challenge'))
+    # All challenges: fire the requests together rather than one after another
+    elif challenge_choice == 'A':
+        primers = asyncio.run(_generate_all_primers(
+            agent, challenges_to_process, experience_level, lesson_file, module_number
+        ))
+    else:
+        primers = [None]
+
     # Process selected challenge(s)
-    for idx, lesson in challenges_to_process:
+    for (idx, lesson), primer in zip(challenges_to_process, primers):
         challenge_number = lesson.get('lesson_number', idx + 1)
         challenge_title = lesson.get('title', 'Unknown Challenge')
         topics = lesson.get('topics_covered', [])
         learning_objectives = lesson.get('learning_objectives', [])
         
-        print(f"\n{'='*80}")
-        print(f"GENERATING PRIMER FOR CHALLENGE {challenge_number}")
-        print(f"{'='*80}")
-        
-        # Generate primer
-        primer = agent.run(
-            lesson_title=challenge_title,
-            topics_covered=topics,
-            experience_level=experience_level,
-            learning_objectives=learning_objectives
-        )
-        
-        # Display primer
-        print_primer(primer, challenge_title)
+        if primer is None:
+            print(f"\n{'='*80}")
+            print(f"GENERATING PRIMER FOR CHALLENGE {challenge_number}")
+            print(f"{'='*80}")
+
+            # Generate primer
+            primer = agent.run(
+                lesson_title=challenge_title,
+                topics_covered=topics,
+                experience_level=experience_level,
+                learning_objectives=learning_objectives
+            )
+
+            # Display primer
+            print_primer(primer, challenge_title)
         
         # Store for saving
-        all_primers.append({
-            'challenge_number': challenge_number,
-            'challenge_title': challenge_title,
-            'topics_covered': topics,
-            'learning_objectives': learning_objectives,
-            'primer': primer
-        })
+        all_primers.append(_primer_entry(idx, lesson, primer))
     
     # Save primers to file
     if challenge_choice == 'A':
@@ -374,8 +874,7 @@ def main():
         output_file = lesson_file.replace('LessonPlan', f'Primer_M{module_number}_C{challenge_number}')
         output_data = all_primers[0] if all_primers else {}
     
-    with open(output_file, 'w') as f:
-        json.dump(output_data, f, indent=2)
+    _write_json(output_file, output_data)
     
     print(f"\n\n✅ Saved primer(s) to: {output_file}")
     
@@ -0,0 +1,169 @@
+"""
+Semantic Cache - Near-duplicate Learning Path Reuse
+
+Embeds (baseline, objective) requests with Gemini embeddings and answers
+requests whose meaning matches a stored one with the stored learning path,
+skipping a multi-second generation call.
+"""
+
+import copy
+import logging
+import os
+import re
+import threading
+import numpy as np
+import orjson
+from google.genai import types
+
+logger = logging.getLogger(__name__)
+
+EMBEDDING_MODEL = "gemini-embedding-001"
+EMBEDDING_DIM = 768
+
+# Similarity at or above HIT_THRESHOLD is a direct hit. Between GRAY_ZONE and
+# HIT_THRESHOLD the objectives must also share most of their words.
+HIT_THRESHOLD = 0.92
+GRAY_ZONE = 0.86
+GRAY_ZONE_MIN_JACCARD = 0.5
+
+_WORD_RE = re.compile(r"[a-z0-9]+")
+
+
+def _goal_tokens(text: str) -> set:
+    """Lowercased word set used for the gray-zone overlap check."""
+    return set(_WORD_RE.findall(text.lower()))
+
+
+class SemanticCache:
+    """
+    In-memory embedding cache with optional on-disk persistence.
+
+    Embeddings are kept as one normalized float32 matrix, so a lookup is a
+    single matrix-vector product against every stored request.
+    """
+
+    def __init__(self, cache_dir: str = None, max_entries: int = 1024,
+                 threshold: float = HIT_THRESHOLD, gray_zone: float = GRAY_ZONE):
+        """
+        Initialize the cache, loading persisted entries if cache_dir has them.
+
+        Args:
+            cache_dir: Directory for embeddings.f32 / responses.jsonl (None = memory only)
+            max_entries: Oldest entries are evicted beyond this size
+            threshold: Cosine similarity for a direct hit
+            gray_zone: Lowest similarity that may hit after the word-overlap check
+        """
+        self.cache_dir = cache_dir
+        self.max_entries = max_entries
+        self.threshold = threshold
+        self.gray_zone = gray_zone
+        self.embeddings = np.empty((0, EMBEDDING_DIM), dtype=np.float32)
+        self.entries = []  # [{"goal": str, "response": dict}], aligned with embeddings rows
+        self._lock = threading.Lock()
+
+        if cache_dir:
+            self._load()
+
+    def embed(self, client, user_context: str, user_goal: str) -> np.ndarray:
+        """Embed a request as a unit-length vector."""
+        response = client.models.embed_content(
+            model=EMBEDDING_MODEL,
+            contents=f"{user_context} || {user_goal}",
+            config=types.EmbedContentConfig(
+                task_type="SEMANTIC_SIMILARITY",
+                output_dimensionality=EMBEDDING_DIM,
+            ),
+        )
+        vector = np.asarray(response.embeddings[0].values, dtype=np.float32)
+        # Truncated Gemini embeddings are not normalized
+        return vector / np.linalg.norm(vector)
+
+    def lookup(self, client, user_context: str, user_goal: str):
+        """
+        Find a stored response for a semantically equivalent request.
+
+        Args:
+            client: Google GenAI client used for the embedding call
+            user_context: The user's current baseline
+            user_goal: The user's objective
+
+        Returns:
+            Tuple of (cached result or None, query embedding to pass to store())
+        """
+        query = self.embed(client, user_context, user_goal)
+
+        with self._lock:
+            if not self.entries:
+                return None, query
+            sims = self.embeddings @ query
+            best = int(np.argmax(sims))
+            similarity = float(sims[best])
+            entry = self.entries[best]
+
+        if similarity < self.gray_zone:
+            return None, query
+
+        if similarity < self.threshold:
+            # Gray zone: close embeddings, so confirm the objectives really match
+            goal_a, goal_b = _goal_tokens(user_goal), _goal_tokens(entry["goal"])
+            union = goal_a | goal_b
+            if not union or len(goal_a & goal_b) / len(union) < GRAY_ZONE_MIN_JACCARD:
+                return None, query
+
+        return {**copy.deepcopy(entry["response"]), "token_usage": None, "cache_hit": True}, query
+
+    def store(self, query: np.ndarray, user_goal: str, result: dict):
+        """Store a generated result under the embedding returned by lookup()."""
+        entry = {"goal": user_goal, "response": {"learning_path": copy.deepcopy(result["learning_path"])}}
+
+        with self._lock:
+            self.embeddings = np.vstack([self.embeddings, query[np.newaxis, :]])
+            self.entries.append(entry)
+            evicted = len(self.entries) > self.max_entries
+            if evicted:
+                self.embeddings = self.embeddings[-self.max_entries:]
+                self.entries = self.entries[-self.max_entries:]
+
+            if self.cache_dir:
+                # Both files are append-only until eviction forces a rewrite
+                self._save(rewrite=evicted)
+
+    def _paths(self):
+        return (
+            # Raw float32 rows rather than .npy, so a new entry is a plain append
+            os.path.join(self.cache_dir, "embeddings.f32"),
+            os.path.join(self.cache_dir, "responses.jsonl"),
+        )
+
+    def _load(self):
+        """Load persisted entries, ignoring a missing or mismatched cache."""
+        embeddings_path, responses_path = self._paths()
+        if not (os.path.exists(embeddings_path) and os.path.exists(responses_path)):
+            return
+
+        embeddings = np.fromfile(embeddings_path, dtype=np.float32)
+        with open(responses_path, "rb") as f:
+            entries = [orjson.loads(line) for line in f if line.strip()]
+
+        if embeddings.size != len(entries) * EMBEDDING_DIM:
+            logger.warning("Semantic cache in %s is inconsistent, starting empty", self.cache_dir)
+            return
+
+        self.embeddings = embeddings.reshape(len(entries), EMBEDDING_DIM)
+        self.entries = entries
+
+    def _save(self, rewrite: bool):
+        """Persist entries, appending only the newest one unless told to rewrite (caller holds the lock)."""
+        os.makedirs(self.cache_dir, exist_ok=True)
+        embeddings_path, responses_path = self._paths()
+        if rewrite or not (os.path.exists(embeddings_path) and os.path.exists(responses_path)):
+            with open(embeddings_path, "wb") as f:
+                f.write(self.embeddings.tobytes())
+            with open(responses_path, "wb") as f:
+                for entry in self.entries:
+                    f.write(orjson.dumps(entry) + b"\n")
+        else:
+            with open(embeddings_path, "ab") as f:
+                f.write(self.embeddings[-1].tobytes())
+            with open(responses_path, "ab") as f:
+                f.write(orjson.dumps(self.entries[-1]) + b"\n")
@@ -3,16 +3,20 @@ FastAPI Backend for Adaptive Learning OS - Multi-tenant with Supabase Auth
 Exposes REST API for personalized technical learning with AI agents
 """
 
+import asyncio
 import os
+import orjson
 from typing import Optional, Dict, Any
 from fastapi import FastAPI, HTTPException, Depends, Header
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from supabase import create_client, Client
 from dotenv import load_dotenv
 
-from agents.learning_path import LearningPathAgent
+from agents.learning_path import LearningPathAgent, PromptTooLargeError
 from agents.module_planner import ModulePlannerAgent
+from agents.semantic_cache import SemanticCache
 
 from database.db_operations import Database
 from mastery_engine.engine import MasteryEngine
@@ -52,6 +56,28 @@ supabase: Client = create_client(supabase_url, supabase_service_key)
 # Initialize PostgreSQL database
 db = Database()
 
+
+@app.on_event("shutdown")
+def close_database():
+    """Release pooled database connections on shutdown"""
+    db.close()
+
+
+# Optional semantic cache: near-duplicate setups reuse a stored learning path
+learning_path_cache = (
+    SemanticCache(cache_dir=os.getenv("SEMANTIC_CACHE_DIR"))
+    if os.getenv("ENABLE_SEMANTIC_CACHE", "").lower() == "true"
+    else None
+)
+
+# Optional model routing: short /path/adjust feedback goes to the small Groq model
+route_simple_feedback = os.getenv("ROUTE_SIMPLE_FEEDBACK", "").lower() == "true"
+
+# Chapters planned concurrently per wave in /path/approve. Each wave only sees
+# competencies from earlier waves, so 1 (fully sequential) keeps every
+# chapter's prompt aware of all chapters before it.
+planner_wave_size = max(1, int(os.getenv("PLANNER_WAVE_SIZE", "1")))
+
 # In-memory storage for active lesson sessions (per user)
 # Key: (user_id, module_num, challenge_num)
 active_lessons: Dict[tuple, MasteryEngine] = {}
@@ -79,7 +105,7 @@ async def get_current_user(authorization: str = Header(None)) -> str:
         print("🔧 Dev mode: Auth bypassed for local development")
         dev_user_id = "00000000-0000-0000-0000-000000000001"
         # Ensure dev user exists in database
-        db.ensure_dev_user_exists(dev_user_id)
+        await asyncio.to_thread(db.ensure_dev_user_exists, dev_user_id)
         return dev_user_id
 
     if not authorization:
@@ -92,7 +118,8 @@ async def get_current_user(authorization: str = Header(None)) -> str:
 
     try:
         # Verify token with Supabase
-        user_response = supabase.auth.get_user(token)
+        # Blocking HTTP call to Supabase; keep it off the event loop
+        user_response = await asyncio.to_thread(supabase.auth.get_user, token)
 
         if not user_response or not user_response.user:
             raise HTTPException(status_code=401, detail="Invalid or expired token")
@@ -195,7 +222,7 @@ def root():
 # ============================================================
 
 @app.get("/session", response_model=SessionResponse)
-def get_session(user_id: str = Depends(get_current_user)):
+async def get_session(user_id: str = Depends(get_current_user)):
     """
     Load or initialize user session
 
@@ -204,11 +231,11 @@ def get_session(user_id: str = Depends(get_current_user)):
         - path_approval: Learning path generated, awaiting approval
         - dashboard: Learning path approved, ready to view modules
     """
-    # Update last active timestamp
-    db.update_user_last_active(user_id)
-
-    # Get or create user profile
-    user_profile = db.get_user_profile(user_id)
+    # Update last active timestamp and get user profile concurrently
+    _, user_profile = await asyncio.gather(
+        asyncio.to_thread(db.update_user_last_active, user_id),
+        asyncio.to_thread(db.get_user_profile, user_id),
+    )
 
     print(f"🔍 /session: User {user_id[:8]}... | Profile exists: {user_profile is not None}")
 
@@ -222,7 +249,7 @@ def get_session(user_id: str = Depends(get_current_user)):
             progress_summary=None
         )
 
-    learning_path = db.get_learning_path(user_id)
+    learning_path = await asyncio.to_thread(db.get_learning_path, user_id)
     print(f"   Learning path found: {learning_path is not None}")
 
     if not learning_path:
@@ -235,7 +262,7 @@ def get_session(user_id: str = Depends(get_current_user)):
             progress_summary=None
         )
 
-    module_challenges = db.get_all_module_challenges(user_id)
+    module_challenges = await asyncio.to_thread(db.get_all_module_challenges, user_id)
 
     if not module_challenges:
         return SessionResponse(
@@ -246,7 +273,7 @@ def get_session(user_id: str = Depends(get_current_user)):
             progress_summary=None
         )
 
-    progress_summary = db.get_progress_summary(user_id)
+    progress_summary = await asyncio.to_thread(db.get_progress_summary, user_id)
 
     return SessionResponse(
         state="dashboard",
@@ -257,8 +284,49 @@ def get_session(user_id: str = Depends(get_current_user)):
     )
 
 
+async def _save_learning_path_result(user_id: str, request: SetupRequest, learning_path_result: dict):
+    """
+    Save a generated learning path and log its token usage.
+
+    Returns:
+        (learning_path_data, num_chapters)
+    """
+    # The agent returns {"learning_path": {...}}
+    learning_path_content = learning_path_result.get("learning_path", {})
+
+    learning_path_data = {
+        "input": {
+            "user_baseline": request.user_context,
+            "user_objective": request.learning_goal
+        },
+        "learning_path": learning_path_content
+    }
+
+    path_id = await asyncio.to_thread(db.save_learning_path, user_id, learning_path_data)
+    # Support both old (curriculum) and new (chapters) schema
+    chapters = learning_path_content.get('chapters', learning_path_content.get('curriculum', []))
+    num_chapters = len(chapters)
+    print(f"✅ Learning path generated: {num_chapters} chapters")
+
+    # Log token usage
+    token_usage = learning_path_result.get("token_usage")
+    if token_usage:
+        await asyncio.to_thread(
+            db.log_token_usage,
+            user_id=user_id,
+            agent_name="learning_path",
+            prompt_tokens=token_usage["prompt_tokens"],
+            completion_tokens=token_usage["completion_tokens"],
+            total_tokens=token_usage["total_tokens"],
+            model_name=token_usage["model_name"]
+        )
+        print(f"📊 Token usage logged: {token_usage['total_tokens']} tokens")
+
+    return learning_path_data, num_chapters
+
+
 @app.post("/setup")
-def setup(request: SetupRequest, user_id: str = Depends(get_current_user)):
+async def setup(request: SetupRequest, user_id: str = Depends(get_current_user)):
     """
     Initial setup - Generate learning path
 
@@ -272,53 +340,31 @@ def setup(request: SetupRequest, user_id: str = Depends(get_current_user)):
         - learning_path (for approval/editing)
     """
     try:
-        # Create or update user profile
-        user_profile = db.create_or_get_user_profile(
-            user_id=user_id,
-            learning_goal=request.learning_goal,
-            user_context=request.user_context
-        )
-
         print(f"🚀 Generating learning path for user {user_id[:8]}...")
         print(f"   Goal: {request.learning_goal[:50]}...")
 
-        agent = LearningPathAgent()
+        agent = LearningPathAgent(semantic_cache=learning_path_cache)
 
-        # The agent takes user_context (baseline) and user_goal (objective)
-        learning_path_result = agent.generate(
-            user_context=request.user_context,
-            user_goal=request.learning_goal
+        # Write the profile while the path is generated; the agent call runs on the
+        # event loop, so concurrent setups multiplex instead of holding a thread each
+        _, learning_path_result = await asyncio.gather(
+            # Create or update user profile
+            asyncio.to_thread(
+                db.create_or_get_user_profile,
+                user_id=user_id,
+                learning_goal=request.learning_goal,
+                user_context=request.user_context
+            ),
+            # The agent takes user_context (baseline) and user_goal (objective)
+            agent.agenerate(
+                user_context=request.user_context,
+                user_goal=request.learning_goal
+            ),
         )
 
-        # The agent returns {"learning_path": {...}}
-        learning_path_content = learning_path_result.get("learning_path", {})
-
-        learning_path_data = {
-            "input": {
-                "user_baseline": request.user_context,
-                "user_objective": request.learning_goal
-            },
-            "learning_path": learning_path_content
-        }
-
-        path_id = db.save_learning_path(user_id, learning_path_data)
-        # Support both old (curriculum) and new (chapters) schema
-        chapters = learning_path_content.get('chapters', learning_path_content.get('curriculum', []))
-        num_chapters = len(chapters)
-        print(f"✅ Learning path generated: {num_chapters} chapters")
-
-        # Log token usage
-        token_usage = learning_path_result.get("token_usage")
-        if token_usage:
-            db.log_token_usage(
-                user_id=user_id,
-                agent_name="learning_path",
-                prompt_tokens=token_usage["prompt_tokens"],
-                completion_tokens=token_usage["completion_tokens"],
-                total_tokens=token_usage["total_tokens"],
-                model_name=token_usage["model_name"]
-            )
-            print(f"📊 Token usage logged: {token_usage['total_tokens']} tokens")
+        learning_path_data, num_chapters = await _save_learning_path_result(
+            user_id, request, learning_path_result
+        )
 
         return {
             "success": True,
@@ -327,13 +373,79 @@ def setup(request: SetupRequest, user_id: str = Depends(get_current_user)):
             "message": f"Generated {num_chapters} chapters"
         }
 
+    except PromptTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
     except Exception as e:
         print(f"❌ Setup failed: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Setup failed: {str(e)}")
 
 
+@app.post("/setup/stream")
+async def setup_stream(request: SetupRequest, user_id: str = Depends(get_current_user)):
+    """
+    Initial setup with progressive output - same as /setup, streamed as NDJSON
+
+    Each line is one JSON event:
+        {"type": "chapter", "chapter": {...}} as soon as each chapter is generated
+        {"type": "complete", "success": true, "user_id": ..., "learning_path": {...}, "message": ...}
+        {"type": "error", "detail": ...} if generation fails mid-stream
+    """
+    print(f"🚀 Streaming learning path for user {user_id[:8]}...")
+    print(f"   Goal: {request.learning_goal[:50]}...")
+
+    agent = LearningPathAgent(semantic_cache=learning_path_cache)
+
+    async def events():
+        # Create or update user profile while the first chapter is generated
+        profile_task = asyncio.create_task(asyncio.to_thread(
+            db.create_or_get_user_profile,
+            user_id=user_id,
+            learning_goal=request.learning_goal,
+            user_context=request.user_context
+        ))
+
+        try:
+            async for event in agent.generate_stream(
+                user_context=request.user_context,
+                user_goal=request.learning_goal
+            ):
+                if event["type"] == "chapter":
+                    yield orjson.dumps(event) + b"\n"
+                    continue
+
+                await profile_task
+                learning_path_data, num_chapters = await _save_learning_path_result(
+                    user_id, request, event
+                )
+                yield orjson.dumps({
+                    "type": "complete",
+                    "success": True,
+                    "user_id": user_id,
+                    "learning_path": learning_path_data,
+                    "message": f"Generated {num_chapters} chapters"
+                }) + b"\n"
+
+        except Exception as e:
+            # Headers are already sent, so report the failure in-band
+            print(f"❌ Setup failed: {str(e)}")
+            yield orjson.dumps({"type": "error", "detail": f"Setup failed: {str(e)}"}) + b"\n"
+
+        finally:
+            # Generation may fail or the client may disconnect before the profile
+            # task is awaited: cancel it if still pending and always collect its outcome
+            profile_task.cancel()
+            try:
+                await profile_task
+            except asyncio.CancelledError:
+                pass
+            except Exception as e:
+                print(f"⚠️  Profile update failed: {str(e)}")
+
+    return StreamingResponse(events(), media_type="application/x-ndjson")
+
+
 @app.post("/path/adjust")
-def adjust_path(request: PathAdjustmentRequest, user_id: str = Depends(get_current_user)):
+async def adjust_path(request: PathAdjustmentRequest, user_id: str = Depends(get_current_user)):
     """
     Adjust learning path based on user feedback
 
@@ -355,9 +467,9 @@ def adjust_path(request: PathAdjustmentRequest, user_id: str = Depends(get_curre
         print(f"🔄 Adjusting learning path for user {user_id[:8]}...")
         print(f"   Feedback: {request.user_feedback}")
 
-        # Use the agent to regenerate with feedback
-        agent = LearningPathAgent()
-        adjusted_result = agent.regenerate_with_feedback(
+        # Use the agent to regenerate with feedback; short edits may use the small model
+        agent = LearningPathAgent(route_simple_feedback=route_simple_feedback)
+        adjusted_result = await agent.aregenerate_with_feedback(
             original_path=original_path,
             user_feedback=request.user_feedback,
             learning_goal=learning_goal
@@ -376,7 +488,7 @@ def adjust_path(request: PathAdjustmentRequest, user_id: str = Depends(get_curre
         }
 
         # Update the learning path in database
-        db.update_learning_path(user_id, adjusted_learning_path_data)
+        await asyncio.to_thread(db.update_learning_path, user_id, adjusted_learning_path_data)
 
         # Support both old (curriculum) and new (chapters) schema
         chapters = adjusted_path_content.get('chapters', adjusted_path_content.get('curriculum', []))
@@ -386,7 +498,8 @@ def adjust_path(request: PathAdjustmentRequest, user_id: str = Depends(get_curre
         # Log token usage
         token_usage = adjusted_result.get("token_usage")
         if token_usage:
-            db.log_token_usage(
+            await asyncio.to_thread(
+                db.log_token_usage,
                 user_id=user_id,
                 agent_name="learning_path_adjust",
                 prompt_tokens=token_usage["prompt_tokens"],
@@ -403,13 +516,15 @@ def adjust_path(request: PathAdjustmentRequest, user_id: str = Depends(get_curre
             "message": f"Adjusted to {num_chapters} chapters based on feedback"
         }
 
+    except PromptTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
     except Exception as e:
         print(f"❌ Path adjustment failed: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Path adjustment failed: {str(e)}")
 
 
 @app.post("/path/approve")
-def approve_path(request: PathApprovalRequest, user_id: str = Depends(get_current_user)):
+async def approve_path(request: PathApprovalRequest, user_id: str = Depends(get_current_user)):
     """
     Approve learning path and generate module challenges using URAC framework
 
@@ -439,19 +554,36 @@ def approve_path(request: PathApprovalRequest, user_id: str = Depends(get_curren
         # Track acquired knowledge across modules
         acquired_knowledge_history = []
 
-        for i, chapter in enumerate(chapters):
+        # Written together in one transaction once every chapter is planned
+        planned_modules = []
+        token_usages = []
+
+        # Run the module planner agent with URAC framework, a wave of chapters at a time
+        lesson_plan_results = []
+        for start in range(0, len(chapters), planner_wave_size):
+            wave = chapters[start:start + planner_wave_size]
+            history = list(acquired_knowledge_history)
+            wave_results = await asyncio.gather(*[
+                planner_agent.aplan_module(
+                    user_baseline=user_baseline,
+                    user_objective=user_objective,
+                    current_module=chapter,
+                    acquired_knowledge_history=history
+                )
+                for chapter in wave
+            ])
+            # Update acquired knowledge history for the next wave
+            for lesson_plan_result in wave_results:
+                acquired_knowledge_history.extend(
+                    lesson_plan_result.get("acquired_competencies", [])
+                )
+            lesson_plan_results.extend(wave_results)
+
+        for i, (chapter, lesson_plan_result) in enumerate(zip(chapters, lesson_plan_results)):
             # Support both old (module_order) and new (chapter) schema
             chapter_num = chapter.get("chapter", chapter.get("module_order", i + 1))
             print(f"\n   📘 Chapter {chapter_num}: {chapter['title']}")
 
-            # Run the module planner agent with URAC framework
-            lesson_plan_result = planner_agent.plan_module(
-                user_baseline=user_baseline,
-                user_objective=user_objective,
-                current_module=chapter,
-                acquired_knowledge_history=acquired_knowledge_history
-            )
-
             # Count challenges (one per lesson in the URAC framework)
             num_challenges = len(lesson_plan_result.get("lesson_plan", []))
 
@@ -483,29 +615,22 @@ def approve_path(request: PathApprovalRequest, user_id: str = Depends(get_curren
                 }
             }
 
-            db.save_module_challenges(user_id, chapter_num, challenges_data)
-            db.initialize_module_progress(user_id, chapter_num, num_challenges)
+            planned_modules.append({
+                "module_number": chapter_num,
+                "challenges_data": challenges_data,
+                "num_challenges": num_challenges
+            })
 
-            # Log token usage from module planner
+            # Token usage from module planner (None when served from the plan cache)
             token_usage = lesson_plan_result.get("token_usage")
             if token_usage:
-                db.log_token_usage(
-                    user_id=user_id,
-                    agent_name="module_planner",
-                    prompt_tokens=token_usage["prompt_tokens"],
-                    completion_tokens=token_usage["completion_tokens"],
-                    total_tokens=token_usage["total_tokens"],
-                    model_name=token_usage["model_name"]
-                )
-
-            # Update acquired knowledge history for next chapter
-            acquired_knowledge_history.extend(
-                lesson_plan_result.get("acquired_competencies", [])
-            )
+                token_usages.append(token_usage)
 
             total_challenges += num_challenges
             print(f"      ✅ {num_challenges} URAC challenges created")
 
+        await asyncio.to_thread(db.save_approved_modules, user_id, planned_modules, token_usages)
+
         print(f"\n✨ Total: {total_challenges} challenges across {len(chapters)} chapters")
 
         return {
@@ -523,7 +648,7 @@ def approve_path(request: PathApprovalRequest, user_id: str = Depends(get_curren
 
 
 @app.get("/progress")
-def get_progress(user_id: str = Depends(get_current_user)):
+async def get_progress(user_id: str = Depends(get_current_user)):
     """
     Get overall progress summary with individual challenge completion status
 
@@ -535,7 +660,7 @@ def get_progress(user_id: str = Depends(get_current_user)):
         - current_challenge
     """
     try:
-        return db.get_progress_summary(user_id)
+        return await asyncio.to_thread(db.get_progress_summary, user_id)
 
     except Exception as e:
         print(f"❌ Failed to get progress: {str(e)}")
@@ -543,7 +668,7 @@ def get_progress(user_id: str = Depends(get_current_user)):
 
 
 @app.get("/challenges/metadata")
-def get_all_challenges_metadata(user_id: str = Depends(get_current_user)):
+async def get_all_challenges_metadata(user_id: str = Depends(get_current_user)):
     """
     Get all challenge titles and URAC metadata for dashboard display
 
@@ -551,7 +676,7 @@ def get_all_challenges_metadata(user_id: str = Depends(get_current_user)):
         Dictionary mapping module_number to module and challenge metadata with URAC framework
     """
     try:
-        all_module_challenges = db.get_all_module_challenges(user_id)
+        all_module_challenges = await asyncio.to_thread(db.get_all_module_challenges, user_id)
 
         metadata = {}
         for module_data in all_module_challenges:
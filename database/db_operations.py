@@ -4,14 +4,15 @@ Handles all CRUD operations for user profiles, learning paths, module challenges
 """
 
 import os
-import json
+import orjson
 import threading
+import time
 from typing import Optional, List, Dict, Any
 from contextlib import contextmanager
 
 try:
     import psycopg2
-    from psycopg2.extras import RealDictCursor
+    from psycopg2.extras import RealDictCursor, execute_values
     from psycopg2 import pool
 except ImportError:
     raise ImportError(
@@ -19,6 +20,15 @@ except ImportError:
         "Install it with: pip install psycopg2-binary"
     )
 
+# Connection pool sizing. Async endpoints run queries from worker threads,
+# so the pool must cover the concurrent to_thread calls, not just one.
+DB_POOL_MIN = int(os.getenv("DB_POOL_MIN", "2"))
+DB_POOL_MAX = int(os.getenv("DB_POOL_MAX", "20"))
+
+# Pooled connections idle for less than this many seconds skip the SELECT 1
+# liveness check on checkout; failures are still caught by query retries
+POOL_PING_AFTER = 30.0
+
 
 class Database:
     """PostgreSQL database manager for multi-tenant learning system"""
@@ -42,10 +52,12 @@ class Database:
 
     def _create_pool(self):
         """Create or recreate the connection pool"""
+        # Connection -> monotonic time it was last returned to the pool
+        self._last_used = {}
         try:
             self.connection_pool = psycopg2.pool.ThreadedConnectionPool(
-                1,  # min connections
-                10,  # max connections
+                DB_POOL_MIN,
+                DB_POOL_MAX,
                 self.db_url,
                 # Add keepalive settings to detect dead connections faster
                 keepalives=1,
@@ -75,8 +87,11 @@ class Database:
             try:
                 with self._pool_lock:
                     conn = self.connection_pool.getconn()
+                    last_used = self._last_used.pop(conn, None)
 
-                # Test if connection is still alive
+                # Recently used connections are trusted; idle ones are tested
+                if last_used is not None and time.monotonic() - last_used < POOL_PING_AFTER:
+                    return conn
                 if self._test_connection(conn):
                     return conn
 
@@ -121,11 +136,21 @@ class Database:
         finally:
             with self._pool_lock:
                 try:
+                    # The pool rolls back open transactions and closes broken connections
                     self.connection_pool.putconn(conn)
+                    if not conn.closed:
+                        self._last_used[conn] = time.monotonic()
                 except Exception:
                     pass
 
-    def _execute_query(self, query: str, params: tuple = None, fetch_one=False, fetch_all=False):
+    def close(self):
+        """Close every pooled connection (call on application shutdown)"""
+        with self._pool_lock:
+            self._last_used.clear()
+            self.connection_pool.closeall()
+
+    def _execute_query(self, query: str, params: tuple = None, fetch_one=False, fetch_all=False,
+                       async_commit=False):
         """
         Execute a query with automatic connection management and retry logic
 
@@ -134,6 +159,8 @@ class Database:
             params: Query parameters
             fetch_one: Return single row
             fetch_all: Return all rows
+            async_commit: Commit without waiting for the WAL flush (a crash may lose
+                the last few such writes; only for data that tolerates that)
 
         Returns:
             Query result or None
@@ -149,6 +176,9 @@ class Database:
             try:
                 with self._get_connection() as conn:
                     with conn.cursor(cursor_factory=RealDictCursor) as cur:
+                        if async_commit:
+                            # Scoped to this transaction only
+                            cur.execute("SET LOCAL synchronous_commit TO OFF")
                         cur.execute(query, params or ())
 
                         if fetch_one:
@@ -331,7 +361,7 @@ class Database:
             VALUES (%s, %s::jsonb)
             RETURNING id
         """
-        result = self._execute_query(query, (user_id, json.dumps(path_data)), fetch_one=True)
+        result = self._execute_query(query, (user_id, orjson.dumps(path_data).decode()), fetch_one=True)
         return result['id'] if result else None
 
     def get_learning_path(self, user_id: str) -> Optional[Dict[str, Any]]:
@@ -371,7 +401,7 @@ class Database:
                 LIMIT 1
             )
         """
-        self._execute_query(query, (json.dumps(path_data), user_id, user_id))
+        self._execute_query(query, (orjson.dumps(path_data).decode(), user_id, user_id))
 
     def delete_user_learning_path(self, user_id: str):
         """
@@ -413,7 +443,7 @@ class Database:
         """
         result = self._execute_query(
             query,
-            (user_id, module_number, json.dumps(challenges_data)),
+            (user_id, module_number, orjson.dumps(challenges_data).decode()),
             fetch_one=True
         )
         return result['id'] if result else None
@@ -651,6 +681,78 @@ class Database:
                     continue
                 raise
 
+    def save_approved_modules(
+        self,
+        user_id: str,
+        modules: List[Dict[str, Any]],
+        token_usages: List[Dict[str, Any]] = None
+    ):
+        """
+        Save every planned module of an approved path in a single transaction
+
+        Writes what save_module_challenges, initialize_module_progress and
+        log_token_usage would, but with one commit instead of several per module.
+
+        Args:
+            user_id: User UUID
+            modules: Dicts with module_number, challenges_data and num_challenges
+            token_usages: Module planner token usage dicts (prompt_tokens,
+                completion_tokens, model_name) to log alongside
+        """
+        challenge_rows = [
+            (user_id, m["module_number"], orjson.dumps(m["challenges_data"]).decode())
+            for m in modules
+        ]
+        progress_rows = [
+            (user_id, m["module_number"], i, 'not_started')
+            for m in modules
+            for i in range(1, m["num_challenges"] + 1)
+        ]
+        usage_rows = [
+            (user_id, "module_planner", u["prompt_tokens"], u["completion_tokens"],
+             u["prompt_tokens"] + u["completion_tokens"], u.get("model_name"))
+            for u in token_usages or []
+        ]
+
+        max_retries = 3
+        for attempt in range(max_retries):
+            try:
+                with self._get_connection() as conn:
+                    with conn.cursor() as cur:
+                        execute_values(
+                            cur,
+                            """INSERT INTO module_challenges (user_id, module_number, challenges_json)
+                               VALUES %s
+                               ON CONFLICT (user_id, module_number)
+                               DO UPDATE SET challenges_json = EXCLUDED.challenges_json""",
+                            challenge_rows,
+                            template="(%s, %s, %s::jsonb)"
+                        )
+                        if progress_rows:
+                            execute_values(
+                                cur,
+                                """INSERT INTO challenge_progress
+                                   (user_id, module_number, challenge_number, status)
+                                   VALUES %s
+                                   ON CONFLICT (user_id, module_number, challenge_number) DO NOTHING""",
+                                progress_rows
+                            )
+                        if usage_rows:
+                            execute_values(
+                                cur,
+                                """INSERT INTO token_usage
+                                   (user_id, agent_name, prompt_tokens, completion_tokens, total_tokens, model_name)
+                                   VALUES %s""",
+                                usage_rows
+                            )
+                        conn.commit()
+                return
+            except (psycopg2.OperationalError, psycopg2.InterfaceError) as e:
+                if attempt < max_retries - 1:
+                    print(f"⚠️ Save approved modules error (attempt {attempt + 1}/{max_retries}): {e}")
+                    continue
+                raise
+
     def get_progress_summary(self, user_id: str) -> Dict[str, Any]:
         """
         Get overall progress summary for dashboard
@@ -745,9 +847,11 @@ class Database:
             (user_id, agent_name, prompt_tokens, completion_tokens, total_tokens, model_name)
             VALUES (%s, %s, %s, %s, %s, %s)
         """
+        # Cost-tracking rows are not worth a synchronous WAL flush per LLM call
         self._execute_query(
             query,
-            (user_id, agent_name, prompt_tokens, completion_tokens, calculated_total, model_name)
+            (user_id, agent_name, prompt_tokens, completion_tokens, calculated_total, model_name),
+            async_commit=True
         )
 
     def get_user_token_usage(self, user_id: str) -> Dict[str, Any]:
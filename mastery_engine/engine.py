@@ -6,7 +6,7 @@ with Gemini Flash as the LLM backend.
 """
 
 import os
-import json
+import orjson
 import time
 import re
 from typing import Dict, List, Any, Optional
@@ -22,6 +22,11 @@ from mastery_engine.further_reading import get_further_reading
 
 load_dotenv()
 
+# Compiled once for the JSON extraction fallbacks, which run on every malformed turn
+_CODE_FENCE_RE = re.compile(r'```(?:json)?(.*?)(?:```|$)', re.DOTALL)
+_THOUGHT_RE = re.compile(r'thought_process[:\s]*(.*?)(?=conversation_content|$)', re.DOTALL)
+_CONVERSATION_RE = re.compile(r'conversation_content[:\s]*(.*?)(?=editor_content|lesson_status|$)', re.DOTALL)
+
 
 class MasteryEngine:
     """
@@ -41,6 +46,7 @@ class MasteryEngine:
 
         # Data loaded from module_plans.json
         self.module_plans = None
+        self.all_competencies = []
         self.user_baseline = ""
         self.user_objective = ""
 
@@ -48,6 +54,8 @@ class MasteryEngine:
         self.current_module_idx = 0
         self.current_lesson_idx = 0
         self.conversation_history = []
+        # Gemini Content for each history message, built once when appended
+        self._history_contents = []
 
         # Directly loaded acquired knowledge (for API integration)
         self._direct_acquired_knowledge = None
@@ -73,10 +81,11 @@ class MasteryEngine:
 
     def load_lesson_plans(self, file_path: str):
         """Load module plans from JSON file."""
-        with open(file_path, 'r') as f:
-            data = json.load(f)
+        with open(file_path, 'rb') as f:
+            data = orjson.loads(f.read())
 
         self.module_plans = data.get("module_plans", [])
+        self.all_competencies = data.get("all_competencies", [])
         self.user_baseline = data.get("input", {}).get("user_baseline", "")
         self.user_objective = data.get("input", {}).get("user_objective", "")
 
@@ -118,13 +127,15 @@ class MasteryEngine:
                 "lesson_plan": module_data.get("lesson_plan", []),
                 "acquired_competencies": module_data.get("acquired_competencies", [])
             },
-            "acquired_knowledge_at_this_point": acquired_knowledge
+            "competency_slice_end": len(acquired_knowledge)
         }]
+        self.all_competencies = acquired_knowledge
 
         self.current_module_idx = 0
         self.current_lesson_idx = lesson_index
         self._direct_acquired_knowledge = acquired_knowledge
         self.conversation_history = []
+        self._history_contents = []
 
         lesson = self.get_current_lesson()
         if lesson:
@@ -168,7 +179,11 @@ class MasteryEngine:
         # Add knowledge from previous modules
         if self.current_module_idx > 0:
             prev_module = self.module_plans[self.current_module_idx - 1]
-            acquired.extend(prev_module.get("acquired_knowledge_at_this_point", []))
+            if "competency_slice_end" in prev_module:
+                acquired.extend(self.all_competencies[:prev_module["competency_slice_end"]])
+            else:
+                # Files written before all_competencies carry a per-module snapshot
+                acquired.extend(prev_module.get("acquired_knowledge_at_this_point", []))
 
         # Add knowledge from previous lessons in current module
         module = self.get_current_module()
@@ -259,6 +274,7 @@ class MasteryEngine:
             return None
 
         self.conversation_history = []
+        self._history_contents = []
         return self._generate_response(user_input=None)
 
     def process_user_input(self, user_input: str) -> Dict[str, Any]:
@@ -288,6 +304,16 @@ class MasteryEngine:
     # LLM Response Generation
     # =========================================================================
 
+    def _add_to_history(self, role: str, content: str):
+        """Record a message, converting it to Gemini Content once instead of on every turn."""
+        self.conversation_history.append({"role": role, "content": content})
+        self._history_contents.append(
+            types.Content(
+                role=role,
+                parts=[types.Part.from_text(text=content)],
+            )
+        )
+
     def _generate_response(self, user_input: Optional[str]) -> Dict[str, Any]:
         """Generate LLM response with structured JSON output."""
         lesson = self.get_current_lesson()
@@ -302,17 +328,10 @@ class MasteryEngine:
             user_message = "[SYSTEM] Start the lesson. This is your first message to the learner."
         else:
             user_message = user_input
-            self.conversation_history.append({"role": "user", "content": user_input})
+            self._add_to_history("user", user_input)
 
-        # Build contents for Gemini
-        contents = []
-        for msg in self.conversation_history:
-            contents.append(
-                types.Content(
-                    role=msg["role"],
-                    parts=[types.Part.from_text(text=msg["content"])],
-                )
-            )
+        # Build contents for Gemini from the already-converted history
+        contents = list(self._history_contents)
 
         if user_input is None:
             contents.append(
@@ -333,18 +352,22 @@ class MasteryEngine:
         try:
             start_time = time.time()
             usage_metadata = None
-            full_response = ""
+            # Collect chunks and join once; += would copy the growing buffer per chunk
+            parts = []
 
             for chunk in self.client.models.generate_content_stream(
                 model=self.model_name,
                 contents=contents,
                 config=config,
             ):
-                if chunk.text:
-                    full_response += chunk.text
+                text = chunk.text
+                if text:
+                    parts.append(text)
                 if chunk.usage_metadata:
                     usage_metadata = chunk.usage_metadata
 
+            full_response = "".join(parts)
+
             self.last_response_time = time.time() - start_time
 
             if usage_metadata:
@@ -363,7 +386,7 @@ class MasteryEngine:
 
             self._log_response(response_json)
 
-            self.conversation_history.append({"role": "model", "content": full_response})
+            self._add_to_history("model", full_response)
             return response_json
 
         except Exception as e:
@@ -606,30 +629,30 @@ APPLY -> COMPLETED: When learner completes the task successfully
 
         # Strategy 1: Direct parse (response_mime_type should return valid JSON)
         try:
-            result = json.loads(text)
+            result = orjson.loads(text)
             if isinstance(result, dict):
                 return result
-        except json.JSONDecodeError:
+        except orjson.JSONDecodeError:
             pass
 
         # Strategy 2: Markdown code fence extraction
         json_str = self._extract_from_code_fence(text)
 
         try:
-            result = json.loads(json_str)
+            result = orjson.loads(json_str)
             if isinstance(result, dict):
                 return result
-        except json.JSONDecodeError:
+        except orjson.JSONDecodeError:
             pass
 
         # Strategy 3: Find JSON boundaries with brace counting
         json_str = self._extract_by_brace_matching(json_str)
 
         try:
-            result = json.loads(json_str)
+            result = orjson.loads(json_str)
             if isinstance(result, dict):
                 return result
-        except json.JSONDecodeError:
+        except orjson.JSONDecodeError:
             pass
 
         # Strategy 4: json_repair library
@@ -651,14 +674,10 @@ APPLY -> COMPLETED: When learner completes the task successfully
         raise ValueError("Could not extract valid JSON from LLM response")
 
     def _extract_from_code_fence(self, text: str) -> str:
-        """Extract JSON from markdown code fences."""
-        for marker in ["```json", "```"]:
-            start_idx = text.find(marker)
-            if start_idx != -1:
-                end_idx = text.find("```", start_idx + len(marker))
-                if end_idx != -1:
-                    return text[start_idx + len(marker):end_idx].strip()
-                return text[start_idx + len(marker):].strip()
+        """Extract JSON from markdown code fences (an unclosed fence runs to the end)."""
+        match = _CODE_FENCE_RE.search(text)
+        if match:
+            return match.group(1).strip()
         return text
 
     def _extract_by_brace_matching(self, text: str) -> str:
@@ -700,8 +719,8 @@ APPLY -> COMPLETED: When learner completes the task successfully
         """Attempt to reconstruct JSON from unstructured text."""
         print("  No JSON structure found, attempting reconstruction...")
 
-        thought_match = re.search(r'thought_process[:\s]*(.*?)(?=conversation_content|$)', text, re.DOTALL)
-        conv_match = re.search(r'conversation_content[:\s]*(.*?)(?=editor_content|lesson_status|$)', text, re.DOTALL)
+        thought_match = _THOUGHT_RE.search(text)
+        conv_match = _CONVERSATION_RE.search(text)
 
         return {
             "thought_process": thought_match.group(1).strip() if thought_match else "Processing",
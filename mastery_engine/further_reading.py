@@ -4,7 +4,7 @@ Further Reading Module - High-Quality Learning Resources
 Same pattern as grounding.py: JSON from LLM, URLs from grounding_metadata.
 """
 
-import json
+import orjson
 import re
 import time
 from google.genai import types
@@ -138,9 +138,9 @@ def _parse_titles(text: str) -> list:
             else:
                 clean = re.sub(r'^```json\s*|\s*```$', '', text.strip())
 
-        data = json.loads(clean)
+        data = orjson.loads(clean)
         # Extract just the titles, ignore the facts (facts force grounding but we discard them)
         return [r["title"] for r in data.get("resources", []) if isinstance(r, dict) and "title" in r]
-    except (json.JSONDecodeError, AttributeError, KeyError) as e:
+    except (orjson.JSONDecodeError, AttributeError, KeyError) as e:
         print(f"[Further Reading] JSON parse error: {e}")
         return []
@@ -6,7 +6,7 @@ using Google Search grounding. Extracts REAL URLs from grounding_metadata instea
 of relying on LLM-generated URLs.
 """
 
-import json
+import orjson
 import re
 import time
 from google.genai import types
@@ -137,7 +137,7 @@ def _parse_insights(text: str, sources: list) -> list:
     """Parse insight statements and attach source URLs."""
     try:
         clean_text = re.sub(r'^```json\s*|\s*```$', '', text.strip())
-        data = json.loads(clean_text)
+        data = orjson.loads(clean_text)
 
         insights = []
         for i, insight in enumerate(data.get("insights", [])[:2]):
@@ -146,5 +146,5 @@ def _parse_insights(text: str, sources: list) -> list:
                 url = sources[i]["url"] if i < len(sources) else None
                 insights.append({"text": insight, "url": url})
         return insights
-    except (json.JSONDecodeError, AttributeError):
+    except (orjson.JSONDecodeError, AttributeError):
         return []
\ No newline at end of file